@@ -0,0 +1,110 @@
+"""Admission control for validation jobs.
+
+Jobs wait in a bounded FIFO queue and run on a fixed number of runner
+threads, so a burst of uploads cannot grow the thread table and admitted jobs
+keep a predictable start time. Each client may only have a few jobs queued or
+running at once, and uploads reserve their size against the free space of the
+spool directory before they are read. Refusals raise ``Saturated`` with the
+number of seconds after which the client should retry.
+"""
+import logging
+import os
+import queue
+import shutil
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class Saturated(Exception):
+    """Refusal carrying the HTTP status and Retry-After seconds to answer with"""
+
+    def __init__(self, message: str, retry_after: int, status: int = 429):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status = status
+
+
+class AdmissionController:
+    def __init__(self, runners: int = 2, max_pending: int = 10, max_per_client: int = 3,
+                 spool_dir: str = None, min_free_disk: int = 0, retry_after=lambda: 30):
+        self.runners = runners
+        self.max_per_client = max_per_client
+        self.spool_dir = spool_dir
+        self.min_free_disk = min_free_disk
+        self.retry_after = retry_after
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._clients = {}
+        self._reserved = 0
+        self._running = 0
+        self._lock = threading.Lock()
+        self._threads = []
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def check(self, client: str):
+        """Cheap early refusal, before the upload body is read"""
+        with self._lock:
+            if self._clients.get(client, 0) >= self.max_per_client:
+                raise Saturated(f'Too many jobs for this client (limit {self.max_per_client})',
+                                self.retry_after())
+        if self._queue.full():
+            raise Saturated('Too many pending jobs', self.retry_after())
+
+    def admit(self, client: str, job):
+        """Queue ``job`` (a callable) for a runner thread"""
+        with self._lock:
+            if self._clients.get(client, 0) >= self.max_per_client:
+                raise Saturated(f'Too many jobs for this client (limit {self.max_per_client})',
+                                self.retry_after())
+            try:
+                self._queue.put_nowait((client, job))
+            except queue.Full:
+                raise Saturated('Too many pending jobs', self.retry_after())
+            self._clients[client] = self._clients.get(client, 0) + 1
+            if not self._threads:
+                self._start_runners()
+
+    @contextmanager
+    def reserve_disk(self, size: int):
+        """Hold ``size`` bytes of the spool directory while an upload is written"""
+        with self._lock:
+            free = shutil.disk_usage(self.spool_dir or os.getcwd()).free - self._reserved
+            if free - size < self.min_free_disk:
+                raise Saturated('Not enough disk space for the upload', self.retry_after(), 503)
+            self._reserved += size
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._reserved -= size
+
+    def _start_runners(self):
+        for i in range(self.runners):
+            thread = threading.Thread(target=self._run, name=f'job-runner-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            client, job = self._queue.get()
+            with self._lock:
+                self._running += 1
+            try:
+                job()
+            except Exception as e:
+                logger.error(f"Job failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._clients[client] -= 1
+                    if not self._clients[client]:
+                        del self._clients[client]
+                self._queue.task_done()
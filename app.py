@@ -1,244 +1,519 @@
-from flask import Flask, render_template, request, jsonify, send_file, after_this_request
-from werkzeug.utils import secure_filename
-from csv import DictReader, reader
+from flask import (
+    Blueprint, Flask, Request, Response, render_template, request, jsonify, send_file,
+    after_this_request, current_app
+)
+import _thread
+import glob
+import json
 import os
+import signal
+import socket
 import uuid
 import threading
-import csv
-import re
-import dns.resolver
-import smtplib
 import tempfile
+import time
 import logging
-from datetime import datetime
+import weakref
 from concurrent.futures import ThreadPoolExecutor
-import time
+from admission import AdmissionController, Saturated
+from delta import VerdictIndex
+from jobstore import JobStore
+from formats import (
+    KEYED_FORMATS, OUTPUT_FORMATS, RecordReader, check_output_format,
+    detect_input_format, open_result_writer, result_columns, result_values
+)
+from metrics import Gauge, TaskStats, registry
+from report import DomainReport, report_csv
+from tracing import SamplingProfiler, slow_traces
+from validator import DEFAULT_CONFIG, EmailValidator
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-
-# Application configuration
-app.config.update({
-    'MAX_CONTENT_LENGTH': 500 * 1024 * 1024,
-    'UPLOAD_FOLDER': tempfile.gettempdir(),
-    'ALLOWED_EXTENSIONS': {'csv'},
-    'DISPOSABLE_DOMAINS_PATH': 'disposable_domains.txt',
-    'ROLE_PREFIXES': ['admin', 'support', 'info', 'sales', 'contact'],
-    'CACHE_TIMEOUT': 3600,
-    'MAX_WORKERS': 20,
-    'DNS_SERVERS': ['8.8.8.8', '8.8.4.4'],
-    'SMTP_TIMEOUT': 10
-})
-
-tasks = {}
-
-class EmailValidator:
-    # Shared resources with thread-safe access
-    EMAIL_REGEX = re.compile(r'^[\w\.\+\-]+\@[a-zA-Z0-9\-]+\.[a-zA-Z0-9\-\.]+$')
-    _disposable_domains = None
-    _domain_cache = {}
-    _catch_all_cache = {}
-    _cache_lock = threading.Lock()
-    _catch_all_lock = threading.Lock()
-
-    def __init__(self):
-        self._load_disposable_domains()
-        self.resolver = dns.resolver.Resolver()
-        self.resolver.nameservers = app.config['DNS_SERVERS']
-
-    def _load_disposable_domains(self):
-        """Load disposable domains once during initialization"""
-        if self.__class__._disposable_domains is None:
+class SpoolingRequest(Request):
+    """Request that receives large uploaded files as ``upload_<uuid>`` files.
+
+    The files are written to the upload folder, whose free space admission
+    control checks. A task takes its file over with ``keep_upload``; the
+    others are deleted when the request is closed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._spooled = {}
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is None or total_content_length > 500 * 1024:
+            path = os.path.join(current_app.config['UPLOAD_FOLDER'], f'upload_{uuid.uuid4()}')
+            stream = open(path, 'wb+')
+            self._spooled[stream] = path
+            return stream
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+    def keep_upload(self, file):
+        """Path of the file an upload was received into (None if it is in memory)"""
+        return self._spooled.pop(file.stream, None)
+
+    def close(self):
+        super().close()
+        for path in self._spooled.values():
             try:
-                with open(app.config['DISPOSABLE_DOMAINS_PATH']) as f:
-                    self.__class__._disposable_domains = {line.strip() for line in f}
+                os.remove(path)
             except FileNotFoundError:
-                logger.warning("Disposable domains file not found")
-                self.__class__._disposable_domains = set()
-
-    def validate(self, email: str) -> dict:
-        """Validate email with optimized checks and early exits"""
-        result = {
-            'email': email,
-            'syntax_valid': False,
-            'domain_valid': False,
-            'smtp_valid': False,
-            'is_disposable': False,
-            'is_role': False,
-            'is_catch_all': False,
-            'errors': []
-        }
-
-        try:
-            # Fast syntax validation
-            if not self.EMAIL_REGEX.match(email):
-                raise ValueError("Invalid email syntax")
-            
-            result['syntax_valid'] = True
-            local_part, domain = email.split('@', 1)
-
-            # Early exit for disposable domains
-            if domain in self._disposable_domains:
-                result['is_disposable'] = True
-                return result
-
-            # Role-based account detection
-            result['is_role'] = any(
-                local_part.lower().startswith(prefix)
-                for prefix in app.config['ROLE_PREFIXES']
-            )
-
-            # Domain validation with caching
-            result['domain_valid'] = self.check_domain(domain)
-            if not result['domain_valid']:
-                raise ValueError("Domain validation failed")
-
-            # SMTP validation
-            result['smtp_valid'] = self.check_smtp(email, domain)
-            
-            # Catch-all domain check
-            result['is_catch_all'] = self.check_catch_all(domain)
-
-        except Exception as e:
-            result['errors'].append(str(e))
-
-        return result
-
-    def check_domain(self, domain: str) -> bool:
-        """Check domain MX records with caching"""
-        now = time.time()
-        with self._cache_lock:
-            cached = self._domain_cache.get(domain)
-            if cached and (now - cached[1]) < app.config['CACHE_TIMEOUT']:
-                return cached[0]
-
-        try:
-            mx_records = self.resolver.resolve(domain, 'MX', lifetime=5)
-            valid = len(mx_records) > 0
-            with self._cache_lock:
-                self._domain_cache[domain] = (valid, now)
-            return valid
-        except Exception as e:
-            logger.debug(f"Domain check failed: {str(e)}")
-            with self._cache_lock:
-                self._domain_cache[domain] = (False, now)
-            return False
+                pass
+        self._spooled.clear()
+
+bp = Blueprint('emailvalid', __name__)
+
+# Task managers of every app in this process, for the process-wide metrics
+_managers = weakref.WeakSet()
+
+def create_app(config: dict = None) -> Flask:
+    """Create the app; settings come from ``config`` and the EMAILVALID_SETTINGS file"""
+    app = Flask(__name__)
+    app.request_class = SpoolingRequest
+
+    # Application configuration
+    app.config.update({
+        **DEFAULT_CONFIG,
+        'MAX_CONTENT_LENGTH': 500 * 1024 * 1024,
+        'UPLOAD_FOLDER': tempfile.gettempdir(),
+        'ALLOWED_EXTENSIONS': {'csv', 'tsv', 'tab', 'ndjson', 'jsonl', 'parquet', 'gz', 'zst', 'zip'},
+        'MAX_WORKERS': 20,
+        # Admission control: tasks run on MAX_RUNNING_TASKS runner threads, at most
+        # MAX_PENDING_TASKS wait, and each client may have MAX_TASKS_PER_CLIENT of both
+        'MAX_RUNNING_TASKS': 2,
+        'MAX_PENDING_TASKS': 10,
+        'MAX_TASKS_PER_CLIENT': 3,
+        'MIN_FREE_DISK': 1024 * 1024 * 1024,
+        'RETRY_AFTER': 30,
+        'TRACE_BUFFER_SIZE': 200,
+        'DEBUG_ENDPOINTS': False,
+        # "host:port" to hand tasks to `python -m distributed worker` processes (default host 127.0.0.1)
+        'COORDINATOR_ADDRESS': None,
+        # Shared token the workers must send; required with COORDINATOR_ADDRESS
+        'COORDINATOR_TOKEN': None,
+        'COORDINATOR_CHUNK_SIZE': 500,
+        'COORDINATOR_LEASE_TIMEOUT': 120,
+        # A distributed task fails when no worker leases or completes a chunk for this long
+        'COORDINATOR_IDLE_TIMEOUT': 360,
+        # Keep a fingerprint index of each task's verdicts for later delta jobs
+        'WRITE_VERDICT_INDEX': True,
+        'DELTA_MAX_AGE': 30 * 24 * 3600,
+        # Task records shared by the server processes (default: jobs.sqlite in UPLOAD_FOLDER)
+        'JOB_STORE_PATH': None,
+        'JOB_PUBLISH_INTERVAL': 1,
+        'JOB_RETENTION': 7 * 24 * 3600,
+        # Seconds a shutting down process waits for its queued and running tasks
+        'DRAIN_TIMEOUT': 600
+    })
+    app.config.from_envvar('EMAILVALID_SETTINGS', silent=True)
+    if config:
+        app.config.update(config)
+
+    # The slow trace buffer is shared by every app of the process
+    slow_traces.resize(app.config['TRACE_BUFFER_SIZE'])
+    app.extensions['emailvalid'] = TaskManager(app.config)
+    app.register_blueprint(bp)
+    return app
+
+def _manager() -> 'TaskManager':
+    return current_app.extensions['emailvalid']
+
+class TaskManager:
+    """Tasks of one app: those running in this process and the records of all of them"""
+
+    def __init__(self, config):
+        self.config = config
+        self.tasks = {}
+        self.draining = False
+        self._store = None
+        self._admission = None
+        self._coordinator = None
+        self._publisher = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        _managers.add(self)
+
+    @property
+    def owner(self) -> str:
+        return f'{socket.gethostname()}-{os.getpid()}'
+
+    @property
+    def store(self) -> JobStore:
+        """Job store shared with the other server processes, opened on first use"""
+        with self._lock:
+            if self._store is None:
+                path = self.config['JOB_STORE_PATH'] or os.path.join(self.config['UPLOAD_FOLDER'], 'jobs.sqlite')
+                # Running tasks are republished every interval; much older records are orphans
+                self._store = JobStore(path, stale_after=max(60, 10 * self.config['JOB_PUBLISH_INTERVAL']))
+            return self._store
+
+    @property
+    def admission(self) -> AdmissionController:
+        """Admission controller for uploads, created on first use"""
+        with self._lock:
+            if self._admission is None:
+                self._admission = AdmissionController(
+                    self.config['MAX_RUNNING_TASKS'], self.config['MAX_PENDING_TASKS'],
+                    self.config['MAX_TASKS_PER_CLIENT'], self.config['UPLOAD_FOLDER'],
+                    self.config['MIN_FREE_DISK'], self.retry_after
+                )
+            return self._admission
+
+    @property
+    def coordinator(self):
+        """Coordinator serving task chunks to remote workers, started on first use"""
+        with self._lock:
+            if self._coordinator is None:
+                from distributed import Coordinator
+                if not self.config['COORDINATOR_TOKEN']:
+                    raise RuntimeError('COORDINATOR_TOKEN must be set with COORDINATOR_ADDRESS')
+                host, _, port = self.config['COORDINATOR_ADDRESS'].rpartition(':')
+                try:
+                    self._coordinator = Coordinator(
+                        (host or '127.0.0.1', int(port)), self.config['COORDINATOR_CHUNK_SIZE'],
+                        self.config['COORDINATOR_LEASE_TIMEOUT'], self.config['COORDINATOR_TOKEN']
+                    ).start()
+                except OSError as e:
+                    raise RuntimeError(
+                        f"Cannot listen on COORDINATOR_ADDRESS {self.config['COORDINATOR_ADDRESS']} ({e}); "
+                        f"coordinator mode needs a single server process"
+                    ) from e
+                logger.info(f"Coordinator listening on {self._coordinator.url}")
+            return self._coordinator
+
+    def retry_after(self) -> int:
+        """Seconds until a runner is likely free: the shortest ETA of the running tasks"""
+        etas = [
+            task.stats.snapshot(task.total_rows)['eta_seconds']
+            for task in list(self.tasks.values()) if task.status == 'processing'
+        ]
+        etas = [eta for eta in etas if eta]
+        return max(1, min(etas)) if etas else self.config['RETRY_AFTER']
+
+    def queue_depth(self) -> int:
+        # ThreadPoolExecutor has no public accessor for its pending work items
+        return sum(
+            executor._work_queue.qsize()
+            for executor in [task.executor for task in list(self.tasks.values())]
+            if executor is not None
+        )
+
+    def index_path(self, task_id: str) -> str:
+        return os.path.join(self.config['UPLOAD_FOLDER'], f'index_{task_id}.sqlite')
+
+    def report_path(self, task_id: str) -> str:
+        return os.path.join(self.config['UPLOAD_FOLDER'], f'report_{task_id}.json')
+
+    def add(self, task: 'ValidationTask'):
+        with self._lock:
+            self.tasks[task.task_id] = task
+            if self._publisher is None:
+                self._publisher = threading.Thread(target=self._publish_loop, name='job-publisher', daemon=True)
+                self._publisher.start()
+        self.store.put([task.record()])
+
+    def discard(self, task: 'ValidationTask'):
+        """Forget a task that was never queued"""
+        with self._lock:
+            self.tasks.pop(task.task_id, None)
+        self.store.delete(task.task_id)
+
+    def finish(self, task: 'ValidationTask', status: str, error: str = None):
+        """Publish the final state of a task, then hand it over to the store"""
+        record = task.record()
+        record.update(status=status, error=error, progress=100 if status == 'completed' else record['progress'])
+        store = self.store
+        with self._lock:
+            if task.task_id not in self.tasks:
+                # Already failed by a drain that timed out
+                return
+            store.put([record])
+            task.status = status
+            task.error = error
+            del self.tasks[task.task_id]
+
+    def get(self, task_id: str):
+        """Status record of a task run by any server process, or None"""
+        task = self.tasks.get(task_id)
+        if task is not None:
+            return task.record()
+        return self.store.get(task_id)
+
+    def _publish_loop(self):
+        last_prune = 0
+        while not self._stopped.wait(self.config['JOB_PUBLISH_INTERVAL']):
+            try:
+                records = [task.record() for task in list(self.tasks.values())]
+                if records:
+                    self.store.put(records)
+                if time.monotonic() - last_prune > 3600:
+                    last_prune = time.monotonic()
+                    self.store.prune(self.config['JOB_RETENTION'])
+                    # Reports outlive the download of their results until the retention period ends
+                    self._prune_files(self.report_path('*'), self.config['JOB_RETENTION'])
+                    # Every verdict of an index untouched for DELTA_MAX_AGE is too old to be reused
+                    self._prune_files(self.index_path('*'), self.config['DELTA_MAX_AGE'])
+            except Exception as e:
+                logger.error(f"Error publishing task state: {str(e)}")
 
-    def check_smtp(self, email: str, domain: str) -> bool:
-        """Perform SMTP check with timeout"""
-        try:
-            mx_records = self.resolver.resolve(domain, 'MX', lifetime=5)
-            mx_server = str(mx_records[0].exchange)
-            
-            with smtplib.SMTP(mx_server, timeout=app.config['SMTP_TIMEOUT']) as server:
-                server.docmd('HELO example.com')
-                server.docmd(f'MAIL FROM:<verify@{domain}>')
-                code, _ = server.docmd(f'RCPT TO:<{email}>')
-                return code == 250
-        except Exception as e:
-            logger.debug(f"SMTP check failed: {str(e)}")
-            return False
-
-    def check_catch_all(self, domain: str) -> bool:
-        """Check catch-all status with caching"""
-        now = time.time()
-        with self._catch_all_lock:
-            cached = self._catch_all_cache.get(domain)
-            if cached and (now - cached[1]) < app.config['CACHE_TIMEOUT']:
-                return cached[0]
-
-        test_email = f'test-{datetime.now().timestamp()}@{domain}'
-        is_catch_all = self.check_smtp(test_email, domain)
-        with self._catch_all_lock:
-            self._catch_all_cache[domain] = (is_catch_all, now)
-        return is_catch_all
+    @staticmethod
+    def _prune_files(pattern: str, max_age: float):
+        oldest = time.time() - max_age
+        for path in glob.glob(pattern):
+            try:
+                if os.path.getmtime(path) < oldest:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def drain(self, timeout: float = None) -> bool:
+        """Refuse new uploads and wait for the queued and running tasks.
+
+        Tasks still unfinished after ``timeout`` seconds (DRAIN_TIMEOUT by
+        default) are recorded as failed. Returns whether all of them finished.
+        """
+        self.draining = True
+        timeout = self.config['DRAIN_TIMEOUT'] if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        if self.tasks:
+            logger.info(f"Draining {len(self.tasks)} tasks")
+        while self.tasks and time.monotonic() < deadline:
+            time.sleep(0.2)
+        unfinished = list(self.tasks.values())
+        for task in unfinished:
+            self.finish(task, 'failed', 'The server shut down before the task completed')
+        self._stopped.set()
+        if self._coordinator is not None:
+            self._coordinator.stop()
+        if unfinished:
+            logger.warning(f"Shut down with {len(unfinished)} unfinished tasks")
+        return not unfinished
+
+registry.register(Gauge(
+    'emailvalid_active_jobs', 'Validation tasks currently processing',
+    lambda: sum(
+        1 for tasks in list(_managers) for task in list(tasks.tasks.values()) if task.status == 'processing'
+    )
+))
+registry.register(Gauge(
+    'emailvalid_executor_queue_depth', 'Emails queued for a worker thread',
+    lambda: sum(manager.queue_depth() for manager in list(_managers))
+))
+registry.register(Gauge(
+    'emailvalid_pending_jobs', 'Validation tasks waiting for a runner',
+    lambda: sum(manager._admission.pending for manager in list(_managers) if manager._admission is not None)
+))
 
 class ValidationTask:
-    def __init__(self, file_path: str, email_column: str, has_headers: bool):
+    def __init__(self, file_path: str, email_column: str, has_headers: bool,
+                 output_format: str = 'csv', keep_original: bool = False,
+                 input_format: str = 'csv', compression: str = None,
+                 trace: bool = False, base_index: str = None, manager: TaskManager = None):
+        # Tasks created outside a request (benchmarks, scripts) belong to the module's app
+        self.manager = manager or app.extensions['emailvalid']
+        self.config = self.manager.config
         self.task_id = str(uuid.uuid4())
         self.file_path = file_path
         self.email_column = email_column
         self.has_headers = has_headers
+        self.output_format = output_format
+        self.keep_original = keep_original
+        self.input_format = input_format
+        self.compression = compression
+        self.trace = trace
+        self.base_index = base_index
         self.progress = 0
         self.status = 'pending'
         self.result_file = None
         self.total_rows = 0
         self.processed_rows = 0
-        tasks[self.task_id] = self
+        self.executor = None
+        self.stats = TaskStats()
+        self.report = None
+        self.error = None
+        self.manager.add(self)
+
+    def record(self) -> dict:
+        """Current state, as published to the job store"""
+        stats = self.stats.snapshot(self.total_rows)
+        progress = self.progress
+        if self.status == 'processing' and self.total_rows:
+            progress = max(progress, int((stats['validated'] + stats['reused']) / self.total_rows * 100))
+        return {
+            'task_id': self.task_id,
+            'status': self.status,
+            'progress': min(progress, 100),
+            'error': self.error,
+            'total_rows': self.total_rows,
+            'output_format': self.output_format,
+            'result_file': self.result_file,
+            'stats': stats,
+            'owner': self.manager.owner,
+        }
 
     def process(self):
-        """Process CSV file with parallel validation"""
+        """Process uploaded file with parallel validation"""
         try:
             self.status = 'processing'
-            validator = EmailValidator()
+            validator = EmailValidator(self.config, self.stats, self.trace, self.task_id)
+            self.report = DomainReport(validator.providers)
+            # Input rows are only kept when they are copied to the results
+            rows = [] if self.keep_original else None
             emails = []
 
-            # Collect emails from CSV
-            with open(self.file_path, 'r', encoding='utf-8') as f:
-                csv_reader = DictReader(f) if self.has_headers else reader(f)
-                if self.has_headers:
-                    next(csv_reader)  # Skip header row
-                
-                for row in csv_reader:
-                    email = (row[self.email_column] if self.has_headers 
-                            else row[int(self.email_column)]).strip()
+            # Collect emails in a single streaming pass over the upload
+            with RecordReader(self.file_path, self.input_format,
+                              self.compression, self.has_headers) as records:
+                original_columns = records.columns
+                if records.has_headers:
+                    get_email = lambda row: row.get(self.email_column) or ''
+                else:
+                    col_index = int(self.email_column)
+                    get_email = lambda row: row[col_index] if len(row) > col_index else ''
+
+                for row in records:
+                    email = str(get_email(row)).strip()
                     if email:
+                        if rows is not None:
+                            rows.append(row)
                         emails.append(email)
+                self.has_headers = records.has_headers
 
             self.total_rows = len(emails)
             if self.total_rows == 0:
                 raise ValueError("No valid emails found")
 
-            # Parallel validation
-            with ThreadPoolExecutor(max_workers=app.config['MAX_WORKERS']) as executor:
-                results = list(executor.map(validator.validate, emails))
-
-            # Write results to CSV
-            self.result_file = os.path.join(app.config['UPLOAD_FOLDER'], f'results_{self.task_id}.csv')
-            with open(self.result_file, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    'Email', 'Valid Syntax', 'Valid Domain', 'SMTP Valid',
-                    'Disposable', 'Role Account', 'Catch-All Domain', 'Errors'
-                ])
-                
+            # Delta job: reuse fresh verdicts of the base task, validate the rest
+            reused = {}
+            if self.base_index:
+                with VerdictIndex.open_existing(self.base_index) as index:
+                    reused = index.lookup(emails, self.config['DELTA_MAX_AGE'])
+                self.stats.inc('reused', amount=len(reused))
+                for result, _ in reused.values():
+                    self.report.add(result)
+            todo = [i for i in range(len(emails)) if i not in reused]
+            todo_emails = [emails[i] for i in todo]
+
+            if not todo_emails:
+                fresh = []
+                self.stats.finish()
+            elif self.config['COORDINATOR_ADDRESS']:
+                # Workers validate domain-affine chunks; results come back in input order
+                def on_result(result):
+                    self.stats.inc('verdict', validator.verdict(result))
+                    self.report.add(result)
+                coordinator = self.manager.coordinator
+                job = coordinator.submit(todo_emails, on_result=on_result)
+                try:
+                    fresh = job.wait(idle_timeout=self.config['COORDINATOR_IDLE_TIMEOUT'])
+                except TimeoutError:
+                    coordinator.cancel(job)
+                    raise
+                finally:
+                    self.stats.finish()
+            else:
+                fresh = self._validate_locally(validator, todo_emails)
+
+            validated_at = time.time()
+            results = [None] * len(emails)
+            times = [validated_at] * len(emails)
+            for position, result in zip(todo, fresh):
+                results[position] = result
+            for position, (result, reused_at) in reused.items():
+                results[position] = result
+                times[position] = reused_at
+            if self.config['WRITE_VERDICT_INDEX']:
+                with VerdictIndex(self.manager.index_path(self.task_id)) as index:
+                    index.write(zip(emails, results, times))
+            prefilter = validator.prefilter
+            if prefilter is not None and self.config['PREFILTER_LEARN'] and prefilter.learn(fresh):
+                prefilter.save()
+
+            # Write results in the requested format
+            if self.keep_original and original_columns is None:
+                width = max(len(row) for row in rows)
+                original_columns = [f'Column {i + 1}' for i in range(width)]
+            columns = result_columns(original_columns if self.keep_original else None)
+            extension = OUTPUT_FORMATS[self.output_format][0]
+            self.result_file = os.path.join(self.config['UPLOAD_FOLDER'], f'results_{self.task_id}{extension}')
+            writer = open_result_writer(self.result_file, self.output_format, columns)
+            try:
                 for idx, result in enumerate(results):
-                    writer.writerow([
-                        result['email'],
-                        result['syntax_valid'],
-                        result['domain_valid'],
-                        result['smtp_valid'],
-                        result['is_disposable'],
-                        result['is_role'],
-                        result['is_catch_all'],
-                        '; '.join(result['errors'])
-                    ])
+                    values = result_values(result)
+                    if self.keep_original:
+                        row = rows[idx]
+                        if self.has_headers:
+                            row = [row.get(name) for name in original_columns]
+                        else:
+                            row = row + [None] * (len(original_columns) - len(row))
+                        values = row + values[1:]
+                    writer.write(values)
                     self.processed_rows = idx + 1
                     self.progress = min(100, int((self.processed_rows / self.total_rows) * 100))
+            finally:
+                writer.close()
+            self._write_report()
 
-            self.status = 'completed'
+            self.manager.finish(self, 'completed')
             logger.info(f"Task {self.task_id} completed successfully")
 
         except Exception as e:
             logger.error(f"Task {self.task_id} failed: {str(e)}")
-            self.status = 'failed'
-            self.error = str(e)
+            self.manager.finish(self, 'failed', str(e))
         finally:
             try:
                 os.remove(self.file_path)
             except Exception as e:
                 logger.error(f"Error cleaning up input file: {str(e)}")
 
+    def _write_report(self):
+        """Save the domain report next to the results (atomically: other processes serve it)"""
+        path = self.manager.report_path(self.task_id)
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump({'task_id': self.task_id, **self.report.to_dict()}, f)
+        os.replace(f'{path}.tmp', path)
+
+    def _validate_locally(self, validator: EmailValidator, emails: list) -> list:
+        """Parallel validation in this process"""
+        def validate(email):
+            result = validator.validate(email)
+            self.report.add(result)
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.config['MAX_WORKERS'],
+                                thread_name_prefix=f'validate-{self.task_id}') as executor:
+            self.executor = executor
+            try:
+                return list(executor.map(validate, emails))
+            finally:
+                self.executor = None
+                self.stats.finish()
+
 # Flask Routes
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/upload', methods=['POST'])
+@bp.route('/upload', methods=['POST'])
 def handle_upload():
+    # Refuse before the body is spooled when the client or the queue is at its limit
+    manager = _manager()
+    admission = manager.admission
+    client = request.remote_addr or 'unknown'
+    try:
+        if manager.draining:
+            raise Saturated('The server is shutting down', manager.config['RETRY_AFTER'], 503)
+        admission.check(client)
+        upload_size = request.content_length or current_app.config['MAX_CONTENT_LENGTH']
+        with admission.reserve_disk(upload_size):
+            return _accept_upload(manager, admission, client)
+    except Saturated as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, e.status
+
+def _accept_upload(manager: TaskManager, admission: AdmissionController, client: str):
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'No file uploaded'}), 400
@@ -247,39 +522,77 @@ def handle_upload():
         if file.filename == '':
             return jsonify({'error': 'No selected file'}), 400
             
+        try:
+            input_format, compression = detect_input_format(file.filename)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         if not allowed_file(file.filename):
             return jsonify({'error': 'Invalid file type'}), 400
 
         email_column = request.form.get('email_column', '0')
         has_headers = request.form.get('has_headers', 'true').lower() == 'true'
+        output_format = request.form.get('output_format', 'csv').lower()
+        keep_original = request.form.get('keep_original', 'false').lower() == 'true'
+        trace = request.form.get('trace', 'false').lower() == 'true'
+        try:
+            check_output_format(output_format)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        # Save uploaded file
-        filename = secure_filename(file.filename)
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"upload_{uuid.uuid4()}.csv")
-        file.save(temp_path)
+        base_index = None
+        base_task_id = request.form.get('base_task_id')
+        if base_task_id:
+            try:
+                base_index = manager.index_path(str(uuid.UUID(base_task_id)))
+            except ValueError:
+                return jsonify({'error': 'Invalid base task ID'}), 400
+            if not os.path.exists(base_index):
+                return jsonify({'error': 'No verdict index for the base task'}), 404
 
-        # Validate CSV structure
-        with open(temp_path, 'r', encoding='utf-8') as f:
-            if has_headers:
-                try:
-                    headers = next(reader(f))
-                    if email_column not in headers:
-                        return jsonify({'error': f'Column "{email_column}" not found'}), 400
-                except StopIteration:
-                    return jsonify({'error': 'Empty CSV file'}), 400
-            else:
-                try:
-                    first_row = next(reader(f))
-                    col_index = int(email_column)
-                    if col_index >= len(first_row):
-                        return jsonify({'error': f'Column index {col_index} out of range'}), 400
-                except (ValueError, StopIteration):
-                    return jsonify({'error': 'Invalid CSV format'}), 400
-
-        # Create and start task
-        task = ValidationTask(temp_path, email_column, has_headers)
-        thread = threading.Thread(target=task.process)
-        thread.start()
+        # Validate structure from the first record of the upload stream
+        try:
+            with RecordReader(file.stream, input_format, compression, has_headers) as records:
+                first_row = next(iter(records), None)
+                columns = records.columns
+                has_headers = records.has_headers
+        except Exception as e:
+            return jsonify({'error': f'Invalid {input_format.upper()} file: {e}'}), 400
+        if first_row is None:
+            return jsonify({'error': 'Empty file'}), 400
+        if has_headers:
+            if email_column not in columns and email_column.isdigit() and input_format in KEYED_FORMATS:
+                # Keyed formats have no header toggle; accept a column index
+                if int(email_column) < len(columns):
+                    email_column = columns[int(email_column)]
+            if email_column not in columns:
+                return jsonify({'error': f'Column "{email_column}" not found'}), 400
+        else:
+            try:
+                col_index = int(email_column)
+            except ValueError:
+                return jsonify({'error': 'Invalid column index'}), 400
+            if col_index >= len(first_row):
+                return jsonify({'error': f'Column index {col_index} out of range'}), 400
+
+        # Keep the upload as received (still compressed) for a single streaming pass
+        temp_path = request.keep_upload(file)
+        if temp_path is None:
+            temp_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"upload_{uuid.uuid4()}")
+            file.stream.seek(0)
+            file.save(temp_path)
+        else:
+            file.close()
+
+        # Create the task and queue it for a runner thread
+        task = ValidationTask(temp_path, email_column, has_headers,
+                              output_format, keep_original,
+                              input_format, compression, trace, base_index, manager)
+        try:
+            admission.admit(client, task.process)
+        except Saturated:
+            manager.discard(task)
+            os.remove(temp_path)
+            raise
         
         return jsonify({
             'task_id': task.task_id,
@@ -287,48 +600,130 @@ def handle_upload():
             'download_url': f'/download/{task.task_id}'
         })
 
+    except Saturated:
+        raise
     except Exception as e:
         logger.error(f"Upload error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/status/<task_id>')
+@bp.route('/status/<task_id>')
 def get_status(task_id):
-    task = tasks.get(task_id)
-    if not task:
+    record = _manager().get(task_id)
+    if not record:
         return jsonify({'error': 'Invalid task ID'}), 404
         
     return jsonify({
-        'status': task.status,
-        'progress': task.progress,
-        'error': getattr(task, 'error', None)
+        'status': record['status'],
+        'progress': record['progress'],
+        'error': record['error'],
+        'total_rows': record['total_rows'],
+        **record['stats']
     })
 
-@app.route('/download/<task_id>')
+@bp.route('/download/<task_id>')
 def download_results(task_id):
-    task = tasks.get(task_id)
-    if not task or task.status != 'completed':
+    # Taking the record makes the download one-shot across server processes
+    record = _manager().store.take(task_id)
+    if not record or not record['result_file'] or not os.path.exists(record['result_file']):
         return jsonify({'error': 'Result not ready'}), 404
     
     @after_this_request
     def cleanup(response):
         try:
-            if task.result_file and os.path.exists(task.result_file):
-                os.remove(task.result_file)
-            del tasks[task_id]
+            os.remove(record['result_file'])
         except Exception as e:
             logger.error(f"Cleanup error: {str(e)}")
         return response
     
+    extension, mimetype = OUTPUT_FORMATS[record['output_format']]
     return send_file(
-        task.result_file,
-        mimetype='text/csv',
+        record['result_file'],
+        mimetype=mimetype,
         as_attachment=True,
-        download_name='validation_results.csv'
+        download_name=f'validation_results{extension}'
     )
 
+@bp.route('/report/<task_id>')
+def get_report(task_id):
+    """Per-domain and per-MX-provider aggregates of a completed task"""
+    try:
+        path = _manager().report_path(str(uuid.UUID(task_id)))
+    except ValueError:
+        return jsonify({'error': 'Invalid task ID'}), 404
+    try:
+        with open(path) as f:
+            report = json.load(f)
+    except FileNotFoundError:
+        return jsonify({'error': 'Report not ready'}), 404
+
+    report_format = request.args.get('format', 'json').lower()
+    if report_format == 'json':
+        return jsonify(report)
+    if report_format != 'csv':
+        return jsonify({'error': f'Unsupported report format "{report_format}"'}), 400
+    by = request.args.get('by', 'domain')
+    try:
+        body = report_csv(report, by)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response = Response(body, mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename=report_{by}_{task_id}.csv'
+    return response
+
+@bp.route('/debug/traces')
+def get_slow_traces():
+    if not current_app.config['DEBUG_ENDPOINTS']:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify({
+        'threshold_seconds': current_app.config['TRACE_SLOW_SECONDS'],
+        'traces': slow_traces.list(request.args.get('task_id'))
+    })
+
+@bp.route('/debug/profile/<task_id>')
+def profile_task(task_id):
+    """Sample the worker threads of a running task and return folded stacks"""
+    if not current_app.config['DEBUG_ENDPOINTS']:
+        return jsonify({'error': 'Not found'}), 404
+    # Only the process running the task can sample its threads
+    task = _manager().tasks.get(task_id)
+    if not task or task.status != 'processing':
+        return jsonify({'error': 'Task is not running'}), 404
+    try:
+        seconds = min(float(request.args.get('seconds', 10)), 300)
+        interval = max(float(request.args.get('interval', 0.005)), 0.001)
+    except ValueError:
+        return jsonify({'error': 'Invalid profiling parameters'}), 400
+
+    profiler = SamplingProfiler(f'validate-{task_id}', interval)
+    profiler.run(seconds)
+    response = Response(profiler.folded(), mimetype='text/plain')
+    response.headers['Content-Disposition'] = f'attachment; filename=profile_{task_id}.folded'
+    return response
+
+@bp.route('/metrics')
+def get_metrics():
+    return Response(registry.expose(), mimetype='text/plain; version=0.0.4')
+
 def allowed_file(filename: str) -> bool:
     return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+           filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
+
+# Created after the routes are added to the blueprint; served by `python app.py` and `flask run`
+app = create_app()
+
+def _drain_on_sigterm(signum, frame):
+    manager = app.extensions['emailvalid']
+    if manager.draining:
+        return
+
+    def drain():
+        # Status and download requests are still served while tasks finish
+        manager.drain()
+        _thread.interrupt_main()
+    threading.Thread(target=drain, name='drain').start()
 
 if __name__ == '__main__':
+    # Configured here rather than at import so importing the app has no side effects
+    logging.basicConfig(level=logging.INFO)
+    signal.signal(signal.SIGTERM, _drain_on_sigterm)
     app.run(host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
@@ -195,7 +195,7 @@ class ValidationTask:
             self.result_file = os.path.join(app.config['UPLOAD_FOLDER'], f'results_{self.task_id}.csv')
             
             with open(self.file_path, 'r', encoding='utf-8') as infile, \
-                 open(self.result_file, 'w', newline='', encoding='utf-8', buffering=1) as outfile:
+                 open(self.result_file, 'w', newline='', encoding='utf-8', buffering=1024 * 1024) as outfile:
 
                 if self.has_headers:
                     csv_reader = DictReader(infile)
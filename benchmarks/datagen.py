@@ -0,0 +1,102 @@
+"""Synthetic email list generator with realistic domain skew.
+
+Domains follow a Zipf-like distribution: a handful of large providers carry
+most rows and a long tail of small company domains carries the rest. Local
+parts and domain names follow the conventions understood by the fake DNS
+and SMTP servers:
+
+- domains starting with ``dead`` have no MX records
+- local parts starting with ``nosuchuser`` are unknown mailboxes
+"""
+import argparse
+import csv
+import random
+import sys
+from itertools import accumulate
+
+PROVIDERS = [
+    ('gmail.com', 0.30),
+    ('yahoo.com', 0.10),
+    ('outlook.com', 0.07),
+    ('hotmail.com', 0.06),
+    ('icloud.com', 0.03),
+    ('aol.com', 0.02),
+]
+
+DISPOSABLE_DOMAINS = ['mailinator.com', 'guerrillamail.com', '10minutemail.com']
+
+FIRST_NAMES = ['james', 'mary', 'john', 'linda', 'wei', 'fatima', 'carlos', 'anna', 'raj', 'olga']
+LAST_NAMES = ['smith', 'garcia', 'chen', 'khan', 'silva', 'ivanova', 'patel', 'mueller', 'kim', 'brown']
+ROLE_LOCALS = ['admin', 'support', 'info', 'sales', 'contact']
+
+
+def tail_domains(count: int, dead_ratio: float, rng: random.Random) -> list:
+    """Long tail of company domains, a fraction of which have no MX"""
+    domains = []
+    for i in range(count):
+        prefix = 'dead' if rng.random() < dead_ratio else 'corp'
+        domains.append(f'{prefix}{i}.example')
+    return domains
+
+
+def generate(rows: int, seed: int = 1, tail_size: int = 2000, zipf_s: float = 1.1,
+             invalid_ratio: float = 0.02, unknown_ratio: float = 0.10,
+             role_ratio: float = 0.03, disposable_ratio: float = 0.02,
+             dead_ratio: float = 0.05):
+    """Yield (name, email) rows"""
+    rng = random.Random(seed)
+    tail = tail_domains(tail_size, dead_ratio, rng)
+    # Zipf weights over the tail, scaled to the share left by the providers
+    tail_share = 1 - sum(weight for _, weight in PROVIDERS)
+    zipf = [1 / (rank ** zipf_s) for rank in range(1, len(tail) + 1)]
+    scale = tail_share / sum(zipf)
+    domains = [domain for domain, _ in PROVIDERS] + tail
+    cum_weights = list(accumulate([weight for _, weight in PROVIDERS] + [w * scale for w in zipf]))
+
+    for i in range(rows):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        domain = rng.choices(domains, cum_weights=cum_weights)[0]
+        roll = rng.random()
+        if roll < invalid_ratio:
+            email = f'{first}.{last}{i}@@{domain}'
+        elif roll < invalid_ratio + disposable_ratio:
+            email = f'{first}{i}@{rng.choice(DISPOSABLE_DOMAINS)}'
+        elif roll < invalid_ratio + disposable_ratio + role_ratio:
+            email = f'{rng.choice(ROLE_LOCALS)}@{domain}'
+        elif roll < invalid_ratio + disposable_ratio + role_ratio + unknown_ratio:
+            email = f'nosuchuser{i}@{domain}'
+        else:
+            email = f'{first}.{last}{i}@{domain}'
+        yield f'{first.title()} {last.title()}', email
+
+
+def write_csv(path: str, rows: int, **options):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name', 'email'])
+        writer.writerows(generate(rows, **options))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('rows', type=int)
+    parser.add_argument('-o', '--output', default='-', help='output CSV path (default: stdout)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--tail-size', type=int, default=2000, help='number of long-tail domains')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent of the tail')
+    parser.add_argument('--dead-ratio', type=float, default=0.05)
+    parser.add_argument('--unknown-ratio', type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    options = dict(seed=args.seed, tail_size=args.tail_size, zipf_s=args.zipf,
+                   dead_ratio=args.dead_ratio, unknown_ratio=args.unknown_ratio)
+    if args.output == '-':
+        writer = csv.writer(sys.stdout)
+        writer.writerow(['name', 'email'])
+        writer.writerows(generate(args.rows, **options))
+    else:
+        write_csv(args.output, args.rows, **options)
+
+
+if __name__ == '__main__':
+    main()
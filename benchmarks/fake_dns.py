@@ -0,0 +1,82 @@
+"""Stub DNS server answering MX queries for synthetic domains.
+
+Large providers get their real-world MX host names and every other domain
+gets ``mx.<domain>``; the benchmark connects all of them to the fake SMTP
+server. Domains whose first label starts with ``dead`` answer NXDOMAIN.
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+
+PROVIDER_MX = {
+    'gmail.com': 'gmail-smtp-in.l.google.com',
+    'yahoo.com': 'mta5.am0.yahoodns.net',
+    'outlook.com': 'outlook-com.olc.protection.outlook.com',
+    'hotmail.com': 'hotmail-com.olc.protection.outlook.com',
+    'icloud.com': 'mx01.mail.icloud.com',
+    'aol.com': 'mx-aol.mail.gm0.yahoodns.net',
+}
+
+
+class StubDNSHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        data, sock = self.request
+        server = self.server
+        try:
+            query = dns.message.from_wire(data)
+        except Exception:
+            return
+        if server.latency:
+            time.sleep(server.latency)
+
+        response = dns.message.make_response(query)
+        question = query.question[0]
+        name = question.name.to_text().rstrip('.')
+        if name.split('.', 1)[0].startswith('dead'):
+            response.set_rcode(dns.rcode.NXDOMAIN)
+        elif question.rdtype == dns.rdatatype.MX:
+            mx_host = PROVIDER_MX.get(name.lower(), f'mx.{name}')
+            response.answer.append(dns.rrset.from_text(
+                question.name, 300, 'IN', 'MX', f'10 {mx_host}.'
+            ))
+        elif question.rdtype == dns.rdatatype.A:
+            response.answer.append(dns.rrset.from_text(question.name, 300, 'IN', 'A', '127.0.0.1'))
+
+        with server.stats_lock:
+            server.queries += 1
+        sock.sendto(response.to_wire(), self.client_address)
+
+
+class StubDNSServer(socketserver.ThreadingUDPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0):
+        super().__init__(address, StubDNSHandler)
+        self.latency = latency
+        self.queries = 0
+        self.stats_lock = threading.Lock()
+
+
+def serve(host: str = '127.0.0.1', port: int = 5353, latency: float = 0.0):
+    """Run the stub server forever"""
+    server = StubDNSServer((host, port), latency=latency)
+    server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5353)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every answer')
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.latency)
+
+
+if __name__ == '__main__':
+    main()
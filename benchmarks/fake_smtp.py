@@ -0,0 +1,141 @@
+"""Fake SMTP server with configurable latency and mailbox behavior.
+
+Each recipient domain is assigned a behavior from a stable hash of its name,
+according to the configured ratios:
+
+- catch-all: every RCPT is accepted
+- greylist: the first RCPT for an address gets ``451 4.7.1``, retries pass
+- block: every RCPT gets ``554 5.7.1`` as if the client IP were blocklisted
+
+Other domains accept known mailboxes and reject local parts starting with
+``nosuchuser`` (and the random probes used by catch-all checks) with
+``550 5.1.1``. Independently, any RCPT may get a ``450 4.2.1`` temporary
+failure with probability ``tempfail_ratio``.
+"""
+import argparse
+import random
+import socketserver
+import threading
+import time
+import zlib
+from collections import Counter
+
+UNKNOWN_PREFIXES = ('nosuchuser', 'test-', 'invalid-')
+
+
+def domain_bucket(domain: str) -> float:
+    """Stable value in [0, 1) used to pick a domain's behavior"""
+    return zlib.crc32(domain.lower().encode()) / 2 ** 32
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        with server.stats_lock:
+            server.connections += 1
+        if server.connect_latency:
+            time.sleep(server.connect_latency)
+        self.reply('220 fake.localhost ESMTP ready')
+
+        while True:
+            line = self.rfile.readline(1024)
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if server.latency:
+                time.sleep(server.latency)
+
+            if verb in ('HELO', 'EHLO'):
+                self.reply('250 fake.localhost')
+            elif verb == 'MAIL':
+                self.reply('250 2.1.0 OK')
+            elif verb == 'RCPT':
+                self.reply(server.rcpt_reply(command))
+            elif verb in ('RSET', 'NOOP'):
+                self.reply('250 2.0.0 OK')
+            elif verb == 'QUIT':
+                self.reply('221 2.0.0 Bye')
+                return
+            else:
+                self.reply('502 5.5.2 Command not implemented')
+
+    def reply(self, text: str):
+        code = text[:3]
+        with self.server.stats_lock:
+            self.server.replies[code] += 1
+        self.wfile.write(text.encode('ascii') + b'\r\n')
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address, latency: float = 0.0, connect_latency: float = 0.0,
+                 catch_all_ratio: float = 0.1, greylist_ratio: float = 0.05,
+                 block_ratio: float = 0.0, tempfail_ratio: float = 0.0, seed: int = 1):
+        super().__init__(address, FakeSMTPHandler)
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.catch_all_ratio = catch_all_ratio
+        self.greylist_ratio = greylist_ratio
+        self.block_ratio = block_ratio
+        self.tempfail_ratio = tempfail_ratio
+        self.random = random.Random(seed)
+        self.greylisted = set()
+        self.connections = 0
+        self.replies = Counter()
+        self.stats_lock = threading.Lock()
+
+    def rcpt_reply(self, command: str) -> str:
+        address = command.partition('<')[2].partition('>')[0].lower()
+        local, _, domain = address.rpartition('@')
+        bucket = domain_bucket(domain)
+
+        with self.stats_lock:
+            tempfail = self.random.random() < self.tempfail_ratio
+        if tempfail:
+            return '450 4.2.1 Mailbox temporarily unavailable'
+
+        if bucket < self.catch_all_ratio:
+            return '250 2.1.5 OK'
+        bucket -= self.catch_all_ratio
+        if bucket < self.greylist_ratio:
+            with self.stats_lock:
+                first_attempt = address not in self.greylisted
+                self.greylisted.add(address)
+            if first_attempt:
+                return '451 4.7.1 Greylisted, please try again later'
+        elif bucket - self.greylist_ratio < self.block_ratio:
+            return '554 5.7.1 Client host blocked'
+
+        if local.startswith(UNKNOWN_PREFIXES):
+            return '550 5.1.1 User unknown'
+        return '250 2.1.5 OK'
+
+
+def serve(host: str = '127.0.0.1', port: int = 2525, **behavior):
+    """Run the fake server forever"""
+    server = FakeSMTPServer((host, port), **behavior)
+    server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2525)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before every reply')
+    parser.add_argument('--connect-latency', type=float, default=0.0, help='seconds before the banner')
+    parser.add_argument('--catch-all-ratio', type=float, default=0.1)
+    parser.add_argument('--greylist-ratio', type=float, default=0.05)
+    parser.add_argument('--block-ratio', type=float, default=0.0)
+    parser.add_argument('--tempfail-ratio', type=float, default=0.0)
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, latency=args.latency, connect_latency=args.connect_latency,
+          catch_all_ratio=args.catch_all_ratio, greylist_ratio=args.greylist_ratio,
+          block_ratio=args.block_ratio, tempfail_ratio=args.tempfail_ratio)
+
+
+if __name__ == '__main__':
+    main()
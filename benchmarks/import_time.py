@@ -0,0 +1,73 @@
+"""Measure cold-start import time of the engine modules against a budget.
+
+Each module is imported in a fresh interpreter with ``-X importtime``; the
+median of several runs is compared to its budget, and modules that must stay
+light are checked for heavy imports (Flask, dnspython, smtplib).
+
+    python -m benchmarks.import_time --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Module -> (budget in ms, modules it must not import)
+BUDGETS = {
+    'validator': (60, ('flask', 'werkzeug', 'dns', 'smtplib')),
+    'cli': (100, ('flask', 'werkzeug', 'dns', 'smtplib')),
+    'app': (600, ()),
+}
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module: str) -> tuple:
+    """Import ``module`` in a new interpreter; return (cumulative ms, imported names)"""
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stderr
+    total = 0.0
+    imported = set()
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imported.add(name.strip())
+        if name.strip() == module:
+            total = int(cumulative) / 1000
+    return total, imported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--modules', default=','.join(BUDGETS))
+    args = parser.parse_args(argv)
+
+    failed = False
+    print(f"{'module':<10} {'median ms':>9} {'budget ms':>9}  status")
+    for module in args.modules.split(','):
+        budget, forbidden = BUDGETS[module]
+        timings = []
+        for _ in range(args.runs):
+            elapsed, imported = measure(module)
+            timings.append(elapsed)
+        median = statistics.median(timings)
+        heavy = sorted(
+            name for name in imported
+            if any(name == f or name.startswith(f + '.') for f in forbidden)
+        )
+        status = 'ok'
+        if median > budget:
+            status = 'over budget'
+        if heavy:
+            status = f"imports {', '.join(heavy[:3])}"
+        failed = failed or status != 'ok'
+        print(f'{module:<10} {median:>9.1f} {budget:>9}  {status}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""Benchmark the EmailValidator/ValidationTask engines against local fakes.
+
+Starts the stub DNS server and the fake SMTP server in this process,
+generates a synthetic list, then runs every engine/configuration pair in a
+fresh subprocess so peak RSS and socket counts are not shared between runs.
+
+    python -m benchmarks.run --rows 2000 --engines app,app2,appppp --workers 10,20
+"""
+import argparse
+import importlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import resource
+import shutil
+import tempfile
+import threading
+import time
+
+from benchmarks import datagen
+from benchmarks.fake_dns import StubDNSServer
+from benchmarks.fake_smtp import FakeSMTPServer
+
+ENGINES = ('app', 'app2', 'appppp')
+
+
+class SocketSampler(threading.Thread):
+    """Track the peak number of open sockets of the current process"""
+
+    def __init__(self, interval: float = 0.02):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak = max(self.peak, count_sockets())
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def count_sockets() -> int:
+    count = 0
+    for fd in os.listdir('/proc/self/fd'):
+        try:
+            if os.readlink(f'/proc/self/fd/{fd}').startswith('socket:'):
+                count += 1
+        except OSError:
+            pass
+    return count
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[int(q * (len(sorted_values) - 1))]
+
+
+def run_engine(engine: str, csv_path: str, dns_port: int, smtp_port: int,
+               disposable_path: str, config: dict, results):
+    """Subprocess entry point: run one ValidationTask and report its numbers"""
+    import dns.resolver
+    import smtplib
+
+    # Engines without port settings use the library defaults, and every MX
+    # host handed out by the stub DNS server is the local fake SMTP server
+    smtplib.SMTP.default_port = smtp_port
+    get_socket = smtplib.SMTP._get_socket
+    smtplib.SMTP._get_socket = lambda self, host, port, timeout: get_socket(self, '127.0.0.1', port, timeout)
+    resolver = dns.resolver.Resolver(configure=False)
+    resolver.nameservers = ['127.0.0.1']
+    resolver.port = dns_port
+    dns.resolver.default_resolver = resolver
+
+    module = importlib.import_module(engine)
+    # Engines log every task and failed lookup; keep the report readable
+    logging.disable(logging.ERROR)
+    work_dir = tempfile.mkdtemp(prefix='emailvalid-bench-')
+    module.app.config.update({
+        'DNS_SERVERS': ['127.0.0.1'],
+        'DNS_PORT': dns_port,
+        'SMTP_PORT': smtp_port,
+        'DISPOSABLE_DOMAINS_PATH': disposable_path,
+        'UPLOAD_FOLDER': work_dir,
+        **config
+    })
+
+    latencies = []
+    validate = module.EmailValidator.validate
+
+    def timed_validate(self, email):
+        start = time.perf_counter()
+        try:
+            return validate(self, email)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    module.EmailValidator.validate = timed_validate
+
+    input_path = os.path.join(work_dir, 'input.csv')
+    shutil.copyfile(csv_path, input_path)
+    sampler = SocketSampler()
+    sampler.start()
+    start = time.perf_counter()
+    task = module.ValidationTask(input_path, 'email', True)
+    task.process()
+    elapsed = time.perf_counter() - start
+    sampler.stop()
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    latencies.sort()
+    results.put({
+        'status': task.status,
+        'error': getattr(task, 'error', None),
+        'emails': len(latencies),
+        'seconds': elapsed,
+        'emails_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'peak_sockets': sampler.peak,
+    })
+
+
+def start_fakes(args):
+    dns_server = StubDNSServer(('127.0.0.1', 0), latency=args.dns_latency)
+    smtp_server = FakeSMTPServer(
+        ('127.0.0.1', 0), latency=args.smtp_latency, connect_latency=args.connect_latency,
+        catch_all_ratio=args.catch_all_ratio, greylist_ratio=args.greylist_ratio,
+        block_ratio=args.block_ratio, tempfail_ratio=args.tempfail_ratio
+    )
+    for server in (dns_server, smtp_server):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return dns_server, smtp_server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--engines', default=','.join(ENGINES))
+    parser.add_argument('--workers', default='10,20', help='comma-separated MAX_WORKERS values')
+    parser.add_argument('--smtp-timeout', type=float, default=5)
+    parser.add_argument('--dns-latency', type=float, default=0.005)
+    parser.add_argument('--smtp-latency', type=float, default=0.01)
+    parser.add_argument('--connect-latency', type=float, default=0.02)
+    parser.add_argument('--catch-all-ratio', type=float, default=0.1)
+    parser.add_argument('--greylist-ratio', type=float, default=0.05)
+    parser.add_argument('--block-ratio', type=float, default=0.0)
+    parser.add_argument('--tempfail-ratio', type=float, default=0.0)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    dns_server, smtp_server = start_fakes(args)
+    work_dir = tempfile.mkdtemp(prefix='emailvalid-bench-')
+    csv_path = os.path.join(work_dir, 'list.csv')
+    datagen.write_csv(csv_path, args.rows, seed=args.seed)
+    disposable_path = os.path.join(work_dir, 'disposable_domains.txt')
+    with open(disposable_path, 'w') as f:
+        f.write('\n'.join(datagen.DISPOSABLE_DOMAINS))
+
+    context = multiprocessing.get_context('spawn')
+    report = []
+    header = (f"{'engine':<8} {'workers':>7} {'emails/s':>9} {'p50 ms':>8} {'p99 ms':>9} "
+              f"{'RSS MB':>7} {'sockets':>7} {'smtp conns':>10}")
+    print(header)
+    print('-' * len(header))
+    try:
+        for engine, workers in itertools.product(args.engines.split(','), args.workers.split(',')):
+            config = {'MAX_WORKERS': int(workers), 'SMTP_TIMEOUT': args.smtp_timeout}
+            connections_before = smtp_server.connections
+            results = context.Queue()
+            process = context.Process(target=run_engine, args=(
+                engine, csv_path, dns_server.server_address[1], smtp_server.server_address[1],
+                disposable_path, config, results
+            ))
+            process.start()
+            try:
+                row = results.get(timeout=3600)
+            except queue.Empty:
+                row = {'status': 'timeout'}
+            process.join()
+            row.update(engine=engine, workers=int(workers),
+                       smtp_connections=smtp_server.connections - connections_before)
+            report.append(row)
+            if row['status'] != 'completed':
+                print(f"{engine:<8} {workers:>7} failed: {row.get('error') or row['status']}")
+                continue
+            print(f"{engine:<8} {workers:>7} {row['emails_per_second']:>9.1f} {row['p50_ms']:>8.1f} "
+                  f"{row['p99_ms']:>9.1f} {row['peak_rss_mb']:>7.1f} {row['peak_sockets']:>7} "
+                  f"{row['smtp_connections']:>10}")
+    finally:
+        dns_server.shutdown()
+        smtp_server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\nSMTP replies: {dict(smtp_server.replies)}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'arguments': vars(args), 'runs': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""Benchmark the status and download endpoints served by several processes.
+
+Seeds the job store of a scratch upload folder with completed tasks, starts
+``--processes`` server processes (each an app from ``create_app`` sharing the
+folder, as the workers of a production server would) and has ``--clients``
+clients send their requests to the processes in turn, as a load balancer
+would. With ``--server gunicorn`` the processes are the workers of one
+gunicorn server started with ``gunicorn.conf.py`` (gunicorn must be installed).
+
+    python -m benchmarks.serving --processes 4 --clients 16 --seconds 10
+"""
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from benchmarks.run import percentile
+
+
+def serve(work_dir: str, ports):
+    """Subprocess entry point: serve the app on a free port and report it"""
+    from werkzeug.serving import make_server
+
+    from app import create_app
+
+    logging.disable(logging.ERROR)
+    server = make_server('127.0.0.1', 0, create_app({'UPLOAD_FOLDER': work_dir}), threaded=True)
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_gunicorn(work_dir: str, workers: int):
+    """Start gunicorn with the repository settings; return the process and its port"""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    settings = os.path.join(work_dir, 'settings.py')
+    with open(settings, 'w') as f:
+        f.write(f'UPLOAD_FOLDER = {work_dir!r}\n')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(root, 'gunicorn.conf.py'),
+         '--workers', str(workers), '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+        cwd=root, env={**os.environ, 'EMAILVALID_SETTINGS': settings}
+    )
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, port
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError('gunicorn did not start')
+            time.sleep(0.1)
+
+
+def seed(work_dir: str, count: int, rows: int, result_kb: int) -> list:
+    """Completed task records with result files of about ``result_kb`` KiB"""
+    from jobstore import JobStore
+    from metrics import TaskStats
+
+    store = JobStore(os.path.join(work_dir, 'jobs.sqlite'))
+    stats = TaskStats()
+    stats.finish()
+    line = b'someone@example.com,True,True,True,False,False,False,\n'
+    body = line * max(1, result_kb * 1024 // len(line))
+    task_ids = []
+    records = []
+    for _ in range(count):
+        task_id = str(uuid.uuid4())
+        result_file = os.path.join(work_dir, f'results_{task_id}.csv')
+        with open(result_file, 'wb') as f:
+            f.write(body)
+        records.append({
+            'task_id': task_id, 'status': 'completed', 'progress': 100, 'total_rows': rows,
+            'output_format': 'csv', 'result_file': result_file, 'stats': stats.snapshot(rows),
+        })
+        task_ids.append(task_id)
+    store.put(records)
+    store.close()
+    return task_ids
+
+
+def hammer(ports: list, next_path, clients: int, seconds: float) -> dict:
+    """Send requests from ``clients`` threads until time is up or paths run out"""
+    deadline = time.monotonic() + seconds
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client(offset: int):
+        connections = [http.client.HTTPConnection('127.0.0.1', port, timeout=30) for port in ports]
+        mine = []
+        failed = 0
+        for turn in itertools.count(offset):
+            path = next_path()
+            if path is None or time.monotonic() >= deadline:
+                break
+            connection = connections[turn % len(connections)]
+            start = time.perf_counter()
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                failed += response.status != 200
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                failed += 1
+            mine.append(time.perf_counter() - start)
+        for connection in connections:
+            connection.close()
+        with lock:
+            latencies.extend(mine)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server', choices=('werkzeug', 'gunicorn'), default='werkzeug')
+    parser.add_argument('--processes', type=int, default=2, help='server processes')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent client connections')
+    parser.add_argument('--seconds', type=float, default=10, help='duration of each endpoint run')
+    parser.add_argument('--tasks', type=int, default=1000, help='completed tasks seeded for status requests')
+    parser.add_argument('--downloads', type=int, default=2000, help='completed tasks seeded for downloads')
+    parser.add_argument('--result-kb', type=int, default=64, help='size of each result file')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='emailvalid-serving-')
+    context = multiprocessing.get_context('spawn')
+    processes = []
+    report = []
+    try:
+        status_ids = seed(work_dir, args.tasks, 1000, 1)
+        download_ids = seed(work_dir, args.downloads, 1000, args.result_kb)
+
+        if args.server == 'gunicorn':
+            process, port = start_gunicorn(work_dir, args.processes)
+            processes.append(process)
+            ports = [port]
+        else:
+            port_queue = context.Queue()
+            for _ in range(args.processes):
+                process = context.Process(target=serve, args=(work_dir, port_queue), daemon=True)
+                process.start()
+                processes.append(process)
+            ports = [port_queue.get(timeout=60) for _ in processes]
+
+        header = f"{'endpoint':<10} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6}"
+        print(f'{args.server}: {args.processes} server processes, {args.clients} clients')
+        print(header)
+        print('-' * len(header))
+
+        pending = iter(download_ids)
+        pending_lock = threading.Lock()
+
+        def next_download():
+            with pending_lock:
+                task_id = next(pending, None)
+            return f'/download/{task_id}' if task_id else None
+
+        runs = (
+            ('status', lambda: f'/status/{random.choice(status_ids)}'),
+            ('download', next_download),
+        )
+        for endpoint, next_path in runs:
+            row = hammer(ports, next_path, args.clients, args.seconds)
+            row.update(endpoint=endpoint, server=args.server, processes=args.processes, clients=args.clients)
+            report.append(row)
+            print(f"{endpoint:<10} {row['requests']:>8} {row['requests_per_second']:>8.1f} "
+                  f"{row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['errors']:>6}")
+    finally:
+        for process in processes:
+            process.terminate()
+            if isinstance(process, subprocess.Popen):
+                process.wait()
+            else:
+                process.join()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'arguments': vars(args), 'runs': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""Bloom filter of known-bad addresses and dead domains.
+
+The filter is checked at the very start of ``EmailValidator.validate``: an
+address seen before with a definite "no such mailbox" RCPT reply, or whose
+domain answered NXDOMAIN, is rejected without DNS, SMTP or cache lookups.
+Addresses are stored by the same fingerprint as the delta index, so the
+filter can be rebuilt from past tasks' verdict indexes::
+
+    python -m bloom rebuild -o known_bad.bloom /tmp/index_*.sqlite
+
+A Bloom filter has no false negatives and a small, configurable rate of
+false positives: with the default 1e-6, about one valid address in a million
+is wrongly reported as known-bad. Past ``capacity`` entries that rate grows,
+so rebuild with a larger capacity when the warning is logged.
+"""
+import argparse
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import struct
+import sys
+import threading
+
+from delta import fingerprint
+
+logger = logging.getLogger(__name__)
+
+# File header: magic, number of bits, number of hashes, capacity, entries added
+_HEADER = struct.Struct('<4sQIQQ')
+_MAGIC = b'EVBF'
+
+
+class BloomFilter:
+    def __init__(self, capacity: int = 10_000_000, error_rate: float = 1e-6):
+        self.capacity = capacity
+        self.bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.count = 0
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key: bytes):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, key: bytes) -> bool:
+        """Add a key; False when it was already in the filter, which then counts it once"""
+        array = self._array
+        new = False
+        for position in self._positions(key):
+            bit = 1 << (position & 7)
+            if not array[position >> 3] & bit:
+                array[position >> 3] |= bit
+                new = True
+        self.count += new
+        return new
+
+    def __contains__(self, key: bytes) -> bool:
+        array = self._array
+        for position in self._positions(key):
+            if not array[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def save(self, path: str):
+        """Write the filter atomically (readers never see a partial file)"""
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, self.bits, self.hashes, self.capacity, self.count))
+            f.write(self._array)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'BloomFilter':
+        with open(path, 'rb') as f:
+            magic, bits, hashes, capacity, count = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise ValueError(f'{path} is not a Bloom filter file')
+            bloom = cls.__new__(cls)
+            bloom.bits, bloom.hashes, bloom.capacity, bloom.count = bits, hashes, capacity, count
+            bloom._array = bytearray(f.read())
+        if len(bloom._array) != (bits + 7) // 8:
+            raise ValueError(f'{path} is truncated')
+        return bloom
+
+
+class KnownBad:
+    """Known-invalid addresses and dead domains in one Bloom filter"""
+
+    def __init__(self, bloom: BloomFilter, path: str = None):
+        self.bloom = bloom
+        self.path = path
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str, capacity: int = 10_000_000, error_rate: float = 1e-6) -> 'KnownBad':
+        """Load the filter at ``path``, or start an empty one saved there later"""
+        try:
+            return cls(BloomFilter.load(path), path)
+        except FileNotFoundError:
+            return cls(BloomFilter(capacity, error_rate), path)
+
+    @staticmethod
+    def email_key(email_fingerprint: bytes) -> bytes:
+        return b'e' + email_fingerprint
+
+    @staticmethod
+    def domain_key(domain: str) -> bytes:
+        return b'd' + domain.strip().lower().encode()
+
+    def check(self, email: str):
+        """'email' or 'domain' when the address is known bad, else None"""
+        if self.email_key(fingerprint(email)) in self.bloom:
+            return 'email'
+        domain = email.rpartition('@')[2]
+        if domain and self.domain_key(domain) in self.bloom:
+            return 'domain'
+        return None
+
+    def learn(self, results) -> int:
+        """Add the definite failures among validation results; return how many were new"""
+        added = 0
+        with self._lock:
+            for result in results:
+                # A pre-filter hit is already in the filter
+                if result.get('prefiltered'):
+                    continue
+                kind = result.get('known_bad')
+                if kind == 'email':
+                    added += self.bloom.add(self.email_key(fingerprint(result['email'])))
+                elif kind == 'domain':
+                    added += self.bloom.add(self.domain_key(result['email'].rpartition('@')[2]))
+            if added and self.bloom.count > self.bloom.capacity:
+                logger.warning(f"Known-bad filter holds {self.bloom.count} entries for a capacity of "
+                               f"{self.bloom.capacity}; rebuild it with a larger capacity")
+        return added
+
+    def save(self):
+        with self._lock:
+            self.bloom.save(self.path)
+
+
+def rebuild(index_paths: list, capacity: int, error_rate: float) -> BloomFilter:
+    """Build a filter from the known-bad entries of verdict index files"""
+    bloom = BloomFilter(capacity, error_rate)
+    for path in index_paths:
+        db = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            rows = db.execute('SELECT fingerprint, known_bad, domain FROM verdicts WHERE known_bad IS NOT NULL')
+            for email_fingerprint, kind, domain in rows:
+                if kind == 'email':
+                    bloom.add(KnownBad.email_key(email_fingerprint))
+                elif kind == 'domain' and domain:
+                    bloom.add(KnownBad.domain_key(domain))
+        except sqlite3.DatabaseError as e:
+            logger.warning(f"Skipping {path}: {e}")
+        finally:
+            db.close()
+    return bloom
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bloom', description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('rebuild', help='build a filter from verdict index files')
+    build.add_argument('indexes', nargs='+', help='index_<task_id>.sqlite files')
+    build.add_argument('-o', '--output', required=True, help='filter file to write')
+    build.add_argument('--capacity', type=int, default=10_000_000)
+    build.add_argument('--error-rate', type=float, default=1e-6)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(name)s: %(message)s')
+    bloom = rebuild(args.indexes, args.capacity, args.error_rate)
+    bloom.save(args.output)
+    print(f'{bloom.count} entries, {len(bloom._array) / 2 ** 20:.1f} MiB, {bloom.hashes} hashes',
+          file=sys.stderr)
+    if bloom.count > bloom.capacity:
+        print('warning: more entries than capacity, the false positive rate is higher than requested',
+              file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,261 @@
+"""Validate an email list from the command line, without the web app.
+
+    python -m cli list.csv -c email -o results.csv
+    zcat list.csv.gz | python -m cli - -c email --engine dns > results.csv
+
+Records are streamed: at most ``--concurrency * 4`` emails are in flight and
+results are written in input order as soon as they are ready. ``--shard K/N``
+keeps only the emails whose domain hashes to shard K (0-based) of N, so N
+processes given the same file validate disjoint parts and each domain is
+handled by a single process.
+
+With ``--coordinator`` or ``--local-workers`` the list is read in full and
+validated by ``python -m distributed worker`` processes instead (see
+distributed.py), which may run on other machines.
+"""
+import argparse
+import itertools
+import logging
+import os
+import subprocess
+import sys
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from formats import (
+    INPUT_COMPRESSIONS, INPUT_FORMATS, OUTPUT_FORMATS, RecordReader, detect_input_format,
+    open_result_writer, result_columns, result_values
+)
+from metrics import TaskStats
+from validator import DEFAULT_CONFIG, ENGINES, EmailValidator
+
+# Emails submitted ahead of the writer, per worker thread
+WINDOW_PER_WORKER = 4
+
+
+def parse_shard(value: str) -> tuple:
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected K/N, e.g. 0/4')
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError('K must be between 0 and N-1')
+    return index, count
+
+
+def in_shard(email: str, shard: tuple) -> bool:
+    if shard is None:
+        return True
+    index, count = shard
+    domain = email.rpartition('@')[2].lower()
+    return zlib.crc32(domain.encode()) % count == index
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m cli', description=__doc__.splitlines()[0])
+    parser.add_argument('input', help='input file, or - for stdin')
+    parser.add_argument('-c', '--column', default='email',
+                        help='email column name, or 0-based index with --no-header (default: email)')
+    parser.add_argument('--no-header', action='store_true', help='the CSV/TSV input has no header row')
+    parser.add_argument('--input-format', choices=sorted(INPUT_FORMATS),
+                        help='input format (default: from the file name, csv for stdin)')
+    parser.add_argument('--compression', choices=sorted(set(INPUT_COMPRESSIONS.values())),
+                        help='input compression (default: from the file name)')
+    parser.add_argument('-o', '--output', default='-', help='output file, or - for stdout (default)')
+    parser.add_argument('-f', '--output-format', choices=sorted(OUTPUT_FORMATS), default='csv')
+    parser.add_argument('--keep-original', action='store_true',
+                        help='keep the input columns in front of the validation columns')
+    parser.add_argument('--engine', choices=ENGINES, default='smtp',
+                        help='deepest check to run (default: smtp)')
+    parser.add_argument('-j', '--concurrency', type=int, default=20, help='worker threads (default: 20)')
+    parser.add_argument('--shard', type=parse_shard, help='only validate shard K/N of the domains')
+    parser.add_argument('--dns-server', action='append', dest='dns_servers',
+                        help='DNS server to query (repeatable)')
+    parser.add_argument('--smtp-timeout', type=float, default=DEFAULT_CONFIG['SMTP_TIMEOUT'])
+    parser.add_argument('--helo', default=DEFAULT_CONFIG['SMTP_HELO'], help='HELO name for SMTP probes')
+    parser.add_argument('--prefilter', metavar='PATH',
+                        help='Bloom filter of known-bad addresses to check first and extend (see bloom.py)')
+    parser.add_argument('--coordinator', metavar='HOST:PORT',
+                        help='serve the list to `python -m distributed worker` processes on this address '
+                             '(default host: 127.0.0.1)')
+    parser.add_argument('--token', default=os.environ.get('COORDINATOR_TOKEN'),
+                        help='shared token workers must send to --coordinator (default: $COORDINATOR_TOKEN)')
+    parser.add_argument('--local-workers', type=int, default=0,
+                        help='start this many worker processes on this machine (implies --coordinator)')
+    parser.add_argument('--chunk-size', type=int, default=500,
+                        help='emails per chunk handed to a worker (default: 500)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not print the summary')
+    return parser
+
+
+def resolve_input_format(args) -> tuple:
+    fmt, compression = args.input_format, args.compression
+    if args.input != '-' and (fmt is None or compression is None):
+        try:
+            detected_fmt, detected_compression = detect_input_format(args.input)
+        except ValueError:
+            detected_fmt, detected_compression = 'csv', None
+        fmt = fmt or detected_fmt
+        compression = compression or detected_compression
+    return fmt or 'csv', compression
+
+
+def validate_ordered(validator: EmailValidator, items, workers: int):
+    """Yield (row, result) in input order with a bounded number of pending emails"""
+    window = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='validate-cli') as executor:
+        for row, email in items:
+            window.append((row, executor.submit(validator.validate, email)))
+            if len(window) >= workers * WINDOW_PER_WORKER:
+                row, future = window.popleft()
+                yield row, future.result()
+        while window:
+            row, future = window.popleft()
+            yield row, future.result()
+
+
+def parse_address(value: str) -> tuple:
+    host, _, port = value.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def worker_command(url: str, args) -> list:
+    command = [
+        sys.executable, '-m', 'distributed', 'worker', url, '--engine', args.engine,
+        '-j', str(args.concurrency), '--smtp-timeout', str(args.smtp_timeout), '--helo', args.helo,
+    ]
+    for server in args.dns_servers or ():
+        command += ['--dns-server', server]
+    return command
+
+
+def validate_distributed(items, args, stats: TaskStats):
+    """Yield (row, result) in input order, validated by coordinator workers"""
+    # Imported here to keep the HTTP stack out of the single-process start time
+    from distributed import Coordinator
+
+    items = list(items)
+    address = parse_address(args.coordinator) if args.coordinator else ('127.0.0.1', 0)
+    # Without --token only the local workers, which get the random token, can connect
+    coordinator = Coordinator(address, args.chunk_size, token=args.token).start()
+    job = coordinator.submit(
+        [email for _, email in items],
+        on_result=lambda result: stats.inc('verdict', EmailValidator.verdict(result, args.engine))
+    )
+    if not args.quiet:
+        print(f'Coordinator listening on {coordinator.url}', file=sys.stderr)
+    here = os.path.dirname(os.path.abspath(__file__))
+    workers = [
+        subprocess.Popen(worker_command(coordinator.url, args), cwd=here,
+                         env={**os.environ, 'COORDINATOR_TOKEN': coordinator.token})
+        for _ in range(args.local_workers)
+    ]
+    try:
+        results = job.wait()
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+        coordinator.stop()
+    for (row, _), result in zip(items, results):
+        yield row, result
+
+
+def run(args) -> dict:
+    fmt, compression = resolve_input_format(args)
+    config = {'SMTP_TIMEOUT': args.smtp_timeout, 'SMTP_HELO': args.helo}
+    if args.dns_servers:
+        config['DNS_SERVERS'] = args.dns_servers
+    if args.prefilter:
+        config['PREFILTER_PATH'] = args.prefilter
+    stats = TaskStats()
+    validator = EmailValidator(config, stats, engine=args.engine)
+
+    source = sys.stdin.buffer if args.input == '-' else args.input
+    target = sys.stdout.buffer if args.output == '-' else args.output
+    skipped = 0
+    with RecordReader(source, fmt, compression, not args.no_header) as records:
+        if records.has_headers:
+            if records.columns is not None and args.column not in records.columns:
+                raise ValueError(f'Column "{args.column}" not found')
+            get_email = lambda row: row.get(args.column) or ''
+        else:
+            col_index = int(args.column)
+            get_email = lambda row: row[col_index] if len(row) > col_index else ''
+
+        def selected():
+            nonlocal skipped
+            for row in records:
+                email = str(get_email(row)).strip()
+                if email and in_shard(email, args.shard):
+                    yield row, email
+                else:
+                    skipped += 1
+
+        pending = selected()
+        first = next(pending, None)
+        if first is None:
+            raise ValueError('No valid emails found')
+        original_columns = records.columns
+        if args.keep_original and original_columns is None:
+            # Without a header the first row sets the width of the output
+            original_columns = [f'Column {i + 1}' for i in range(len(first[0]))]
+        columns = result_columns(original_columns if args.keep_original else None)
+
+        learned = 0
+        writer = open_result_writer(target, args.output_format, columns)
+        try:
+            items = itertools.chain([first], pending)
+            if args.coordinator or args.local_workers:
+                results = validate_distributed(items, args, stats)
+            else:
+                results = validate_ordered(validator, items, args.concurrency)
+            for row, result in results:
+                if validator.prefilter is not None and result['known_bad']:
+                    learned += validator.prefilter.learn([result])
+                values = result_values(result)
+                if args.keep_original:
+                    if records.has_headers:
+                        row = [row.get(name) for name in original_columns]
+                    else:
+                        row = (row + [None] * len(original_columns))[:len(original_columns)]
+                    values = row + values[1:]
+                writer.write(values)
+        finally:
+            writer.close()
+    if learned:
+        validator.prefilter.save()
+
+    stats.finish()
+    summary = stats.snapshot(0)
+    summary['skipped'] = skipped
+    return summary
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.coordinator and not args.local_workers and not args.token:
+        parser.error('--coordinator needs a shared token for its workers: pass --token or set COORDINATOR_TOKEN')
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(name)s: %(message)s')
+    started = time.monotonic()
+    try:
+        summary = run(args)
+    except (ValueError, OSError) as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    if not args.quiet:
+        verdicts = ', '.join(f'{name}={int(n)}' for name, n in sorted(summary['verdicts'].items()))
+        print(f"{summary['validated']} emails in {time.monotonic() - started:.1f}s "
+              f"({summary['emails_per_second']}/s), {summary['skipped']} skipped: {verdicts}",
+              file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""Fingerprint index of validation results, used to re-validate only changes.
+
+Every completed task can store its verdicts in a SQLite file keyed by a hash
+of the normalized address. A later task given that index as its base reuses
+the verdicts of addresses validated recently enough and only validates new
+or stale ones. Reused verdicts keep their original validation time, so an
+address is re-checked once it is older than the maximum age, however many
+delta jobs ran in between. Only definite verdicts are reused: greylisting and
+other 4xx replies, SMTP sessions that got no RCPT reply and DNS failures
+other than NXDOMAIN are validated again by every delta job.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+
+# Result flags stored as columns, in this order
+_FLAGS = ('syntax_valid', 'domain_valid', 'smtp_valid', 'is_disposable', 'is_role', 'is_catch_all')
+
+# Columns added after the first release, appended to older index files when opened
+_EXTRA_COLUMNS = (('mx_host', 'TEXT'), ('smtp_code', 'INTEGER'))
+
+# Stored columns, in table order
+_COLUMNS = ('fingerprint', *_FLAGS, 'errors', 'known_bad', 'domain', 'validated_at',
+            *(name for name, _ in _EXTRA_COLUMNS))
+
+# Fingerprints per lookup query (SQLite limits the number of parameters)
+_LOOKUP_BATCH = 500
+
+
+def fingerprint(email: str) -> bytes:
+    return hashlib.blake2b(email.strip().lower().encode(), digest_size=16).digest()
+
+
+def is_definite(result: dict) -> bool:
+    """Whether a verdict would come out the same if validated again now"""
+    code = result.get('smtp_code')
+    if code is not None:
+        return not 400 <= code < 500
+    if not result['syntax_valid'] or result['is_disposable'] or result['known_bad']:
+        return True
+    if not result['domain_valid']:
+        # No MX without NXDOMAIN: a timeout or server failure as often as a missing record
+        return False
+    # Past DNS without a RCPT reply: only a provider policy accepting everything is definite
+    return result['smtp_valid']
+
+
+class VerdictIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS verdicts (fingerprint BLOB PRIMARY KEY, '
+            + ', '.join(f'{flag} INTEGER' for flag in _FLAGS)
+            + ', errors TEXT, known_bad TEXT, domain TEXT, validated_at REAL, '
+            + ', '.join(f'{name} {kind}' for name, kind in _EXTRA_COLUMNS) + ')'
+        )
+        existing = {row[1] for row in self._db.execute('PRAGMA table_info(verdicts)')}
+        for name, kind in _EXTRA_COLUMNS:
+            if name not in existing:
+                self._db.execute(f'ALTER TABLE verdicts ADD COLUMN {name} {kind}')
+
+    @classmethod
+    def open_existing(cls, path: str) -> 'VerdictIndex':
+        if not os.path.exists(path):
+            raise FileNotFoundError(f'No verdict index at {path}')
+        return cls(path)
+
+    def lookup(self, emails: list, max_age: float) -> dict:
+        """Fresh (result, validated_at) pairs for the given emails, keyed by position"""
+        oldest = time.time() - max_age
+        positions = {}
+        for position, email in enumerate(emails):
+            positions.setdefault(fingerprint(email), []).append(position)
+
+        found = {}
+        keys = list(positions)
+        for start in range(0, len(keys), _LOOKUP_BATCH):
+            batch = keys[start:start + _LOOKUP_BATCH]
+            rows = self._db.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM verdicts WHERE validated_at >= ? AND fingerprint IN "
+                f"({', '.join('?' * len(batch))})",
+                [oldest, *batch]
+            )
+            for row in rows:
+                for position in positions[row[0]]:
+                    result = self._result(emails[position], row)
+                    if is_definite(result):
+                        found[position] = (result, row[_COLUMNS.index('validated_at')])
+        return found
+
+    def write(self, items):
+        """Store (email, result, validated_at) items, replacing older entries"""
+        with self._db:
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO verdicts ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                (
+                    (fingerprint(email), *(int(result[flag]) for flag in _FLAGS),
+                     '\n'.join(result['errors']), result.get('known_bad'),
+                     # The bare domain is only kept where the filter of dead domains needs it
+                     email.rpartition('@')[2].lower() if result.get('known_bad') == 'domain' else None,
+                     validated_at, result.get('mx_host'), result.get('smtp_code'))
+                    for email, result, validated_at in items
+                )
+            )
+
+    @staticmethod
+    def _result(email: str, row) -> dict:
+        result = {'email': email}
+        result.update((flag, bool(value)) for flag, value in zip(_FLAGS, row[1:]))
+        errors = row[len(_FLAGS) + 1]
+        result['errors'] = errors.split('\n') if errors else []
+        result['known_bad'] = row[len(_FLAGS) + 2]
+        result['mx_host'], result['smtp_code'] = row[-2:]
+        return result
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,480 @@
+"""Coordinator/worker mode: validate one list with several processes or nodes.
+
+The coordinator splits the emails of a job into domain-affine chunks and
+serves them over HTTP; workers pull a chunk, validate it with their own
+EmailValidator and post the results back, which the coordinator stores by
+input position so the merged results keep the input order.
+
+Domains are never split across chunks unless they hold more than a chunk's
+worth of addresses; the parts of such a domain are then only leased to the
+worker that took the first one, so every domain is probed from one worker
+(one source IP, one set of caches). A worker renews its lease while it
+validates the chunk; leases that are neither renewed nor completed within the
+lease timeout are handed out again, and so is the domain ownership of a
+worker that stopped polling. Results are checked against the chunk before
+they are stored: a body that is not a validation result of each leased
+address is refused.
+
+Every request carries the coordinator's shared token as
+``Authorization: Bearer <token>``; others get 401. A coordinator started
+without a token makes up a random one, which only its own local workers know.
+
+Protocol (JSON bodies):
+
+- ``POST /lease {"worker": id}``: 200 with ``{"job_id", "chunk_id", "emails",
+  "lease_timeout"}``, or 204 when there is nothing to do right now
+- ``POST /renew {"worker", "job_id", "chunk_id"}``: 200, or 409 when the lease
+  was lost (expired and handed out again, or the job is gone)
+- ``POST /complete {"worker", "job_id", "chunk_id", "results"}``: 200, or 400
+  when the results do not match the chunk
+- ``GET /status``: progress of the jobs
+
+Run a worker against a coordinator (the web app with ``COORDINATOR_ADDRESS``
+set, or ``python -m cli --coordinator``), with the token in
+``COORDINATOR_TOKEN`` or ``--token``::
+
+    COORDINATOR_TOKEN=... python -m distributed worker http://coordinator:8765 -j 20
+"""
+import argparse
+import hmac
+import json
+import logging
+import os
+import secrets
+import socket
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import error, request
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_LEASE_TIMEOUT = 120
+
+# Fields of a validation result and their types; the others are optional
+_RESULT_FIELDS = {
+    'email': str, 'syntax_valid': bool, 'domain_valid': bool, 'smtp_valid': bool,
+    'is_disposable': bool, 'is_role': bool, 'is_catch_all': bool, 'errors': list,
+}
+_OPTIONAL_FIELDS = {
+    'known_bad': str, 'prefiltered': bool, 'deferred': bool, 'mx_host': str, 'smtp_code': int,
+}
+
+
+def domain_chunks(emails: list, chunk_size: int = DEFAULT_CHUNK_SIZE) -> list:
+    """Group email positions into chunks of whole domains.
+
+    Returns a list of (positions, affinity); ``affinity`` is the domain for the
+    parts of a domain too large for one chunk, and None otherwise.
+    """
+    by_domain = {}
+    for position, email in enumerate(emails):
+        by_domain.setdefault(email.rpartition('@')[2].lower(), []).append(position)
+
+    chunks = []
+    current = []
+    for domain, positions in by_domain.items():
+        if len(positions) > chunk_size:
+            for start in range(0, len(positions), chunk_size):
+                chunks.append((positions[start:start + chunk_size], domain))
+            continue
+        if len(current) + len(positions) > chunk_size:
+            chunks.append((current, None))
+            current = []
+        current.extend(positions)
+    if current:
+        chunks.append((current, None))
+    return chunks
+
+
+class Chunk:
+    def __init__(self, chunk_id: int, positions: list, affinity: str = None):
+        self.chunk_id = chunk_id
+        self.positions = positions
+        self.affinity = affinity
+        self.worker = None
+        self.deadline = None
+        self.done = False
+
+
+class Job:
+    """Emails of one list being validated by the workers"""
+
+    def __init__(self, emails: list, chunk_size: int = DEFAULT_CHUNK_SIZE, on_result=None):
+        self.job_id = uuid.uuid4().hex
+        self.emails = emails
+        self.results = [None] * len(emails)
+        self.chunks = [
+            Chunk(chunk_id, positions, affinity)
+            for chunk_id, (positions, affinity) in enumerate(domain_chunks(emails, chunk_size))
+        ]
+        self.pending = deque(self.chunks)
+        self.remaining = len(self.chunks)
+        self.on_result = on_result
+        # Last time a chunk was leased or completed
+        self.last_activity = time.monotonic()
+        self._done = threading.Event()
+        if not self.chunks:
+            self._done.set()
+
+    def wait(self, timeout: float = None, idle_timeout: float = None) -> list:
+        """Block until every chunk is completed; return results in input order.
+
+        With ``idle_timeout``, give up once no chunk has been leased or
+        completed for that many seconds: no worker is serving the job.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._done.wait(1):
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                raise TimeoutError(f'Job {self.job_id} did not complete in time')
+            if idle_timeout is not None and now - self.last_activity >= idle_timeout:
+                raise TimeoutError(f'No worker leased or completed a chunk for {idle_timeout:g}s')
+        return self.results
+
+
+class Coordinator:
+    """Serves the chunks of submitted jobs to workers over HTTP"""
+
+    def __init__(self, address=('127.0.0.1', 0), chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 lease_timeout: float = DEFAULT_LEASE_TIMEOUT, token: str = None):
+        self.chunk_size = chunk_size
+        self.lease_timeout = lease_timeout
+        self.token = token or secrets.token_urlsafe(32)
+        self.jobs = OrderedDict()
+        self.owners = {}
+        self.last_seen = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(address, _CoordinatorHandler)
+        self.server.daemon_threads = True
+        self.server.coordinator = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        if host in ('0.0.0.0', ''):
+            host = socket.gethostname()
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'Coordinator':
+        self._thread = threading.Thread(target=self.server.serve_forever, name='coordinator', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def authorized(self, header: str) -> bool:
+        """Whether an Authorization header carries the shared token"""
+        scheme, _, token = (header or '').partition(' ')
+        return scheme.lower() == 'bearer' and hmac.compare_digest(token.encode(), self.token.encode())
+
+    def submit(self, emails: list, on_result=None) -> Job:
+        """Queue a list of emails; ``on_result(result)`` is called for each result"""
+        job = Job(emails, self.chunk_size, on_result)
+        with self._lock:
+            self.jobs[job.job_id] = job
+        return job
+
+    def cancel(self, job: Job):
+        """Stop serving a job; results of its outstanding leases are ignored"""
+        with self._lock:
+            self.jobs.pop(job.job_id, None)
+
+    def lease(self, worker: str):
+        """Next chunk for a worker, or None when there is nothing to hand out"""
+        now = time.monotonic()
+        with self._lock:
+            self.last_seen[worker] = now
+            self._expire(now)
+            for job in self.jobs.values():
+                for chunk in job.pending:
+                    if chunk.affinity is not None:
+                        owner = self.owners.get(chunk.affinity)
+                        if owner is not None and owner != worker and self._alive(owner, now):
+                            continue
+                        self.owners[chunk.affinity] = worker
+                    job.pending.remove(chunk)
+                    chunk.worker = worker
+                    chunk.deadline = now + self.lease_timeout
+                    job.last_activity = now
+                    return {
+                        'job_id': job.job_id,
+                        'chunk_id': chunk.chunk_id,
+                        'emails': [job.emails[position] for position in chunk.positions],
+                        'lease_timeout': self.lease_timeout,
+                    }
+        return None
+
+    def renew(self, worker: str, job_id: str, chunk_id: int) -> bool:
+        """Extend a worker's lease on a chunk; False if the worker no longer holds it"""
+        now = time.monotonic()
+        with self._lock:
+            self.last_seen[worker] = now
+            job = self.jobs.get(job_id)
+            if job is None or not 0 <= chunk_id < len(job.chunks):
+                return False
+            chunk = job.chunks[chunk_id]
+            if chunk.done or chunk.worker != worker:
+                return False
+            chunk.deadline = now + self.lease_timeout
+            job.last_activity = now
+            return True
+
+    def complete(self, worker: str, job_id: str, chunk_id: int, results: list):
+        with self._lock:
+            self.last_seen[worker] = time.monotonic()
+            job = self.jobs.get(job_id)
+            if job is None:
+                # Late result of an expired lease for a job that has finished since
+                return
+            if not 0 <= chunk_id < len(job.chunks):
+                raise KeyError(f'Unknown chunk {job_id}:{chunk_id}')
+            chunk = job.chunks[chunk_id]
+            if chunk.done:
+                # A late worker whose lease had expired; the chunk was redone
+                return
+            if not isinstance(results, list) or len(results) != len(chunk.positions):
+                raise ValueError('Result count does not match the chunk')
+            for position, result in zip(chunk.positions, results):
+                _check_result(result, job.emails[position])
+            chunk.done = True
+            job.last_activity = time.monotonic()
+            if chunk in job.pending:
+                job.pending.remove(chunk)
+            for position, result in zip(chunk.positions, results):
+                job.results[position] = result
+            job.remaining -= 1
+            finished = job.remaining == 0
+            if finished:
+                del self.jobs[job_id]
+        if job.on_result is not None:
+            for result in results:
+                job.on_result(result)
+        if finished:
+            job._done.set()
+
+    def _alive(self, worker: str, now: float) -> bool:
+        return now - self.last_seen.get(worker, 0) < self.lease_timeout
+
+    def _expire(self, now: float):
+        for job in self.jobs.values():
+            for chunk in job.chunks:
+                if not chunk.done and chunk.worker is not None and chunk.deadline < now:
+                    logger.warning(f"Lease of chunk {job.job_id}:{chunk.chunk_id} by {chunk.worker} expired")
+                    chunk.worker = None
+                    job.pending.appendleft(chunk)
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'jobs': [
+                    {
+                        'job_id': job.job_id,
+                        'emails': len(job.emails),
+                        'chunks': len(job.chunks),
+                        'pending': len(job.pending),
+                        'remaining': job.remaining,
+                    }
+                    for job in self.jobs.values()
+                ],
+                'workers': sorted(worker for worker in self.last_seen if self._alive(worker, now)),
+            }
+
+
+def _check_result(result, email: str):
+    """Raise ValueError unless ``result`` is a validation result of ``email``"""
+    if not isinstance(result, dict):
+        raise ValueError('A result is not an object')
+    for field, kind in _RESULT_FIELDS.items():
+        if not isinstance(result.get(field), kind):
+            raise ValueError(f'Result field "{field}" is missing or not a {kind.__name__}')
+    for field, kind in _OPTIONAL_FIELDS.items():
+        value = result.get(field)
+        if value is not None and not isinstance(value, kind):
+            raise ValueError(f'Result field "{field}" is not a {kind.__name__}')
+    if result['email'] != email:
+        raise ValueError(f'Result for "{result["email"]}" where "{email}" was leased')
+    if not all(isinstance(message, str) for message in result['errors']):
+        raise ValueError('Result errors are not strings')
+
+
+class _CoordinatorHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if not self.server.coordinator.authorized(self.headers.get('Authorization')):
+            self._reply(401, {'error': 'Missing or wrong token'})
+        elif self.path == '/status':
+            self._reply(200, self.server.coordinator.status())
+        else:
+            self._reply(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        coordinator = self.server.coordinator
+        if not coordinator.authorized(self.headers.get('Authorization')):
+            self._reply(401, {'error': 'Missing or wrong token'})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if self.path == '/lease':
+                lease = coordinator.lease(str(body['worker']))
+                if lease is None:
+                    self._reply(204)
+                else:
+                    self._reply(200, lease)
+            elif self.path == '/renew':
+                if coordinator.renew(str(body['worker']), body['job_id'], int(body['chunk_id'])):
+                    self._reply(200, {'status': 'ok'})
+                else:
+                    self._reply(409, {'error': 'Lease lost'})
+            elif self.path == '/complete':
+                coordinator.complete(str(body['worker']), body['job_id'], int(body['chunk_id']), body['results'])
+                self._reply(200, {'status': 'ok'})
+            else:
+                self._reply(404, {'error': 'Not found'})
+        except (KeyError, ValueError, TypeError) as e:
+            self._reply(400, {'error': str(e)})
+
+    def _reply(self, code: int, payload: dict = None):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        self.send_response(code)
+        if payload is not None:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The worker went away, e.g. stopped once the last chunk was in
+            pass
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def _post(url: str, payload: dict, token: str, timeout: float = 60):
+    data = json.dumps(payload).encode()
+    req = request.Request(url, data=data, headers={
+        'Content-Type': 'application/json', 'Authorization': f'Bearer {token}'
+    })
+    with request.urlopen(req, timeout=timeout) as response:
+        if response.status == 204:
+            return None
+        return json.loads(response.read())
+
+
+def _renew_lease(url: str, token: str, chunk: dict, interval: float, validated: threading.Event):
+    """Renew a lease every ``interval`` seconds until the chunk is validated"""
+    while not validated.wait(interval):
+        try:
+            _post(f'{url}/renew', chunk, token)
+        except error.HTTPError as e:
+            if e.code == 409:
+                logger.warning(f"Lease of chunk {chunk['job_id']}:{chunk['chunk_id']} was lost")
+                return
+            logger.warning(f"Could not renew chunk {chunk['job_id']}:{chunk['chunk_id']}: {e}")
+        except (error.URLError, OSError) as e:
+            logger.warning(f"Could not renew chunk {chunk['job_id']}:{chunk['chunk_id']}: {e}")
+
+
+def run_worker(url: str, worker_id: str = None, config: dict = None, engine: str = 'smtp',
+               concurrency: int = 20, poll_interval: float = 1.0, give_up_after: float = 60,
+               token: str = None):
+    """Pull and validate chunks until the coordinator is unreachable for too long.
+
+    ``token`` defaults to the COORDINATOR_TOKEN environment variable.
+    """
+    token = token or os.environ.get('COORDINATOR_TOKEN')
+    if not token:
+        raise ValueError('No coordinator token: set COORDINATOR_TOKEN or pass --token')
+    from validator import EmailValidator
+
+    url = url.rstrip('/')
+    worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+    validator = EmailValidator(config, engine=engine)
+    unreachable_since = None
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f'validate-{worker_id}') as executor:
+        while True:
+            try:
+                lease = _post(f'{url}/lease', {'worker': worker_id}, token)
+                unreachable_since = None
+            except error.HTTPError as e:
+                if e.code == 401:
+                    logger.error(f"Coordinator refused the token, worker {worker_id} exiting")
+                    return
+                logger.error(f"Lease request failed: {e}")
+                time.sleep(poll_interval)
+                continue
+            except (error.URLError, OSError) as e:
+                now = time.monotonic()
+                unreachable_since = unreachable_since or now
+                if now - unreachable_since >= give_up_after:
+                    logger.error(f"Coordinator unreachable, worker {worker_id} exiting: {e}")
+                    return
+                time.sleep(poll_interval)
+                continue
+            if lease is None:
+                time.sleep(poll_interval)
+                continue
+
+            chunk = {'worker': worker_id, 'job_id': lease['job_id'], 'chunk_id': lease['chunk_id']}
+            validated = threading.Event()
+            renewer = threading.Thread(
+                target=_renew_lease, args=(url, token, chunk, lease['lease_timeout'] / 3, validated),
+                name=f'renew-{worker_id}', daemon=True
+            )
+            renewer.start()
+            try:
+                results = list(executor.map(validator.validate, lease['emails']))
+            finally:
+                validated.set()
+                renewer.join()
+            try:
+                _post(f'{url}/complete', {**chunk, 'results': results}, token)
+            except (error.URLError, OSError) as e:
+                # The lease expires and the chunk is handed out again
+                logger.error(f"Could not return chunk {lease['job_id']}:{lease['chunk_id']}: {e}")
+
+
+def main(argv=None):
+    from validator import DEFAULT_CONFIG, ENGINES
+
+    parser = argparse.ArgumentParser(prog='python -m distributed', description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    worker = commands.add_parser('worker', help='pull and validate chunks from a coordinator')
+    worker.add_argument('url', help='coordinator URL, e.g. http://10.0.0.1:8765')
+    worker.add_argument('--id', help='worker name (default: host-pid)')
+    worker.add_argument('--engine', choices=ENGINES, default='smtp')
+    worker.add_argument('-j', '--concurrency', type=int, default=20)
+    worker.add_argument('--dns-server', action='append', dest='dns_servers')
+    worker.add_argument('--smtp-timeout', type=float, default=DEFAULT_CONFIG['SMTP_TIMEOUT'])
+    worker.add_argument('--helo', default=DEFAULT_CONFIG['SMTP_HELO'])
+    worker.add_argument('--give-up-after', type=float, default=60,
+                        help='seconds without reaching the coordinator before exiting')
+    worker.add_argument('--token', default=os.environ.get('COORDINATOR_TOKEN'),
+                        help="the coordinator's shared token (default: $COORDINATOR_TOKEN)")
+    args = parser.parse_args(argv)
+    if not args.token:
+        parser.error('a coordinator token is required: set COORDINATOR_TOKEN or pass --token')
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(name)s: %(message)s')
+    config = {'SMTP_TIMEOUT': args.smtp_timeout, 'SMTP_HELO': args.helo}
+    if args.dns_servers:
+        config['DNS_SERVERS'] = args.dns_servers
+    try:
+        run_worker(args.url, args.id, config, args.engine, args.concurrency,
+                   give_up_after=args.give_up_after, token=args.token)
+    except KeyboardInterrupt:
+        return 130
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
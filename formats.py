@@ -0,0 +1,344 @@
+import csv
+import io
+import json
+
+# Input format name -> file extensions
+INPUT_FORMATS = {
+    'csv': ('csv',),
+    'tsv': ('tsv', 'tab'),
+    'ndjson': ('ndjson', 'jsonl'),
+    'parquet': ('parquet',),
+}
+
+# Compression suffix -> compression name
+INPUT_COMPRESSIONS = {'gz': 'gzip', 'zst': 'zstd', 'zip': 'zip'}
+
+# Formats whose records are keyed by column name
+KEYED_FORMATS = {'ndjson', 'parquet'}
+
+# Buffer size for streaming reads of uploads
+READ_BUFFER_SIZE = 1024 * 1024
+
+# Buffer size for result writers (rows are flushed in large blocks, not per line)
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Number of rows accumulated before a columnar record batch is written
+COLUMNAR_BATCH_SIZE = 10000
+
+# Verdict columns as (header, result key, type)
+RESULT_COLUMNS = [
+    ('Email', 'email', 'string'),
+    ('Valid Syntax', 'syntax_valid', 'bool'),
+    ('Valid Domain', 'domain_valid', 'bool'),
+    ('SMTP Valid', 'smtp_valid', 'bool'),
+    ('Disposable', 'is_disposable', 'bool'),
+    ('Role Account', 'is_role', 'bool'),
+    ('Catch-All Domain', 'is_catch_all', 'bool'),
+    ('Errors', 'errors', 'string'),
+]
+
+# Output format name -> (file extension, mimetype)
+OUTPUT_FORMATS = {
+    'csv': ('.csv', 'text/csv'),
+    'csv.gz': ('.csv.gz', 'application/gzip'),
+    'csv.zst': ('.csv.zst', 'application/zstd'),
+    'ndjson': ('.ndjson', 'application/x-ndjson'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('.arrow', 'application/vnd.apache.arrow.file'),
+}
+
+
+def detect_input_format(filename: str) -> tuple:
+    """Return (format, compression) for an upload filename"""
+    parts = filename.lower().rsplit('.', 2)[1:]
+    compression = None
+    if parts and parts[-1] in INPUT_COMPRESSIONS:
+        compression = INPUT_COMPRESSIONS[parts.pop()]
+    if compression == 'zip' and not parts:
+        # Plain archive name: assume it holds a CSV
+        return 'csv', compression
+    for fmt, extensions in INPUT_FORMATS.items():
+        if parts and parts[-1] in extensions:
+            if fmt == 'parquet' and compression:
+                raise ValueError('Parquet files are compressed internally and cannot be wrapped')
+            if compression == 'zstd':
+                _require('zstandard', f'{fmt}.zst')
+            if fmt == 'parquet':
+                _require('pyarrow', fmt)
+            return fmt, compression
+    raise ValueError('Invalid file type')
+
+
+class RecordReader:
+    """Streaming reader over an upload, decompressing and parsing on the fly.
+
+    Rows are dicts when the input has headers (or is keyed, like NDJSON and
+    Parquet) and lists otherwise. ``columns`` holds the header names, or the
+    keys of the first record for keyed formats. A file object passed as
+    source is left open on close so it can be rewound and saved.
+    """
+
+    def __init__(self, source, fmt: str, compression=None, has_headers: bool = True):
+        self.fmt = fmt
+        self.has_headers = has_headers or fmt in KEYED_FORMATS
+        self.columns = None
+        self._handles = []
+        if isinstance(source, str):
+            source = self._track(open(source, 'rb', buffering=READ_BUFFER_SIZE))
+        else:
+            source = _KeepOpen(source)
+        self._rows = self._parse(self._decompress(source, compression))
+
+    def _track(self, handle):
+        self._handles.append(handle)
+        return handle
+
+    def _decompress(self, stream, compression):
+        if compression == 'gzip':
+            import gzip
+            return self._track(gzip.GzipFile(fileobj=stream, mode='rb'))
+        if compression == 'zstd':
+            import zstandard
+            return self._track(zstandard.ZstdDecompressor().stream_reader(stream, read_size=READ_BUFFER_SIZE))
+        if compression == 'zip':
+            import zipfile
+            archive = self._track(zipfile.ZipFile(stream))
+            members = [info for info in archive.infolist() if not info.is_dir()]
+            if not members:
+                raise ValueError('Empty zip archive')
+            return self._track(archive.open(members[0]))
+        return stream
+
+    def _parse(self, stream):
+        if self.fmt == 'parquet':
+            return self._parquet_rows(stream)
+        text = self._track(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+        if self.fmt == 'ndjson':
+            return self._ndjson_rows(text)
+        rows = csv.reader(text, delimiter='\t' if self.fmt == 'tsv' else ',')
+        if self.has_headers:
+            self.columns = next(rows, None)
+            if self.columns is None:
+                raise ValueError('Empty file')
+            return (dict(zip(self.columns, row)) for row in rows)
+        return rows
+
+    def _ndjson_rows(self, text):
+        lines = (line for line in text if line.strip())
+        first = next(lines, None)
+        if first is None:
+            raise ValueError('Empty file')
+        record = json.loads(first)
+        self.columns = list(record)
+        return self._chain_keyed(record, (json.loads(line) for line in lines))
+
+    def _parquet_rows(self, stream):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(stream)
+        self.columns = parquet_file.schema_arrow.names
+        return (
+            record
+            for batch in parquet_file.iter_batches(batch_size=COLUMNAR_BATCH_SIZE)
+            for record in batch.to_pylist()
+        )
+
+    def _chain_keyed(self, first: dict, rest):
+        yield first
+        yield from rest
+
+    def __iter__(self):
+        return self._rows
+
+    def close(self):
+        for handle in reversed(self._handles):
+            handle.close()
+        self._handles = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _KeepOpen(io.BufferedIOBase):
+    """Proxy over a caller-owned binary stream; close() only flushes it"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.stream.write(data)
+
+    def flush(self):
+        if hasattr(self.stream, 'flush'):
+            self.stream.flush()
+
+    def seekable(self):
+        return self.stream.seekable()
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+    def read1(self, size=-1):
+        return self.stream.read(size)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.stream.seek(offset, whence)
+
+    def tell(self):
+        return self.stream.tell()
+
+    def close(self):
+        self.flush()
+
+
+def check_output_format(fmt: str):
+    """Raise ValueError if the format is unknown or its library is missing"""
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f'Unsupported output format "{fmt}"')
+    if fmt == 'csv.zst':
+        _require('zstandard', fmt)
+    elif fmt in ('parquet', 'arrow'):
+        _require('pyarrow', fmt)
+
+
+def _require(module: str, fmt: str):
+    try:
+        __import__(module)
+    except ImportError:
+        raise ValueError(f'Output format "{fmt}" requires the {module} package')
+
+
+def result_values(result: dict) -> list:
+    """Verdict values of a validation result in RESULT_COLUMNS order"""
+    values = []
+    for _, key, _ in RESULT_COLUMNS:
+        value = result[key]
+        if key == 'errors':
+            value = '; '.join(value)
+        values.append(value)
+    return values
+
+
+def result_columns(original_columns=None) -> list:
+    """Output columns as (header, type), optionally prefixed by the input columns"""
+    if original_columns is None:
+        return [(header, kind) for header, _, kind in RESULT_COLUMNS]
+    # The email is already part of the original row
+    return [(str(name), 'string') for name in original_columns] + [
+        (header, kind) for header, key, kind in RESULT_COLUMNS if key != 'email'
+    ]
+
+
+def open_result_writer(path, fmt: str, columns: list):
+    """Open a buffered writer for validation results in the given format.
+
+    ``path`` may also be a writable binary stream such as ``sys.stdout.buffer``.
+    """
+    check_output_format(fmt)
+    if fmt in ('parquet', 'arrow'):
+        return ColumnarWriter(path, fmt, columns)
+    if fmt == 'ndjson':
+        return NDJSONWriter(_open_text(path, None), columns)
+    compression = fmt.split('.', 1)[1] if '.' in fmt else None
+    return CSVWriter(_open_text(path, compression), columns)
+
+
+def _open_text(path, compression):
+    if not isinstance(path, str):
+        # Caller-owned stream: flushed but left open when the writer closes
+        stream = _KeepOpen(path)
+        if compression == 'gz':
+            import gzip
+            raw = gzip.GzipFile(fileobj=stream, mode='wb', compresslevel=6)
+        elif compression == 'zst':
+            import zstandard
+            raw = zstandard.ZstdCompressor(level=3).stream_writer(stream)
+        else:
+            raw = stream
+    elif compression == 'gz':
+        import gzip
+        raw = gzip.open(path, 'wb', compresslevel=6)
+    elif compression == 'zst':
+        import zstandard
+        raw = zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'))
+    else:
+        raw = open(path, 'wb', buffering=0)
+    buffered = io.BufferedWriter(raw, buffer_size=WRITE_BUFFER_SIZE)
+    return io.TextIOWrapper(buffered, encoding='utf-8', newline='')
+
+
+class CSVWriter:
+    def __init__(self, stream, columns: list):
+        self.stream = stream
+        self.writer = csv.writer(stream)
+        self.writer.writerow([header for header, _ in columns])
+
+    def write(self, values: list):
+        self.writer.writerow(values)
+
+    def close(self):
+        self.stream.close()
+
+
+class NDJSONWriter:
+    def __init__(self, stream, columns: list):
+        self.stream = stream
+        self.headers = [header for header, _ in columns]
+
+    def write(self, values: list):
+        self.stream.write(json.dumps(dict(zip(self.headers, values))))
+        self.stream.write('\n')
+
+    def close(self):
+        self.stream.close()
+
+
+class ColumnarWriter:
+    """Parquet/Arrow IPC writer emitting typed record batches"""
+
+    def __init__(self, path: str, fmt: str, columns: list):
+        import pyarrow as pa
+
+        self.pa = pa
+        self.schema = pa.schema([
+            (header, pa.bool_() if kind == 'bool' else pa.string())
+            for header, kind in columns
+        ])
+        self.kinds = [kind for _, kind in columns]
+        self.columns = [[] for _ in columns]
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+        else:
+            self.writer = pa.ipc.new_file(path, self.schema)
+
+    def write(self, values: list):
+        for column, kind, value in zip(self.columns, self.kinds, values):
+            if kind == 'string' and value is not None:
+                value = str(value)
+            column.append(value)
+        if len(self.columns[0]) >= COLUMNAR_BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self.columns[0]:
+            batch = self.pa.record_batch(
+                [self.pa.array(column, type=field.type)
+                 for column, field in zip(self.columns, self.schema)],
+                schema=self.schema
+            )
+            self.writer.write_table(self.pa.Table.from_batches([batch]))
+            self.columns = [[] for _ in self.columns]
+
+    def close(self):
+        self._flush()
+        self.writer.close()
@@ -0,0 +1,43 @@
+"""gunicorn settings for serving the app: ``gunicorn -c gunicorn.conf.py``.
+
+Every worker process runs the tasks it accepted on its own runner threads and
+publishes their state to the job store in the upload folder, so status and
+download requests can land on any worker. Admission limits (MAX_RUNNING_TASKS
+and the others) apply per worker.
+"""
+import os
+import sys
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+wsgi_app = 'wsgi:app'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('THREADS', 8))
+timeout = 120
+# Workers drain their tasks for up to DRAIN_TIMEOUT (600s by default) on
+# SIGTERM; give them that long before the master kills them
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', 630))
+# Keeps serving status and downloads while draining (see gunicorn_worker.py)
+worker_class = 'gunicorn_worker.DrainingWorker'
+
+
+def on_starting(server):
+    # A task's coordinator runs in the worker that accepted it; a second worker
+    # could not bind COORDINATOR_ADDRESS and every task it accepted would fail.
+    # Only the settings file is read: workers fork from the master, which must not build the app.
+    from flask import Config
+
+    settings = Config(os.path.dirname(os.path.abspath(__file__)))
+    settings.from_envvar('EMAILVALID_SETTINGS', silent=True)
+    if server.cfg.workers > 1 and settings.get('COORDINATOR_ADDRESS'):
+        server.log.error('COORDINATOR_ADDRESS is set: run a single worker (--workers 1)')
+        sys.exit(1)
+
+
+def worker_exit(server, worker):
+    # Workers leaving without SIGTERM (e.g. max_requests) drain here, no longer serving.
+    # Also called in the master for workers that are already gone.
+    app_module = sys.modules.get('wsgi')
+    if worker.pid == os.getpid() and app_module is not None:
+        manager = app_module.app.extensions['emailvalid']
+        if not manager.draining:
+            manager.drain()
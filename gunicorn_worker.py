@@ -0,0 +1,26 @@
+"""gunicorn worker that drains its validation tasks before exiting.
+
+Used by ``gunicorn.conf.py``; only importable where gunicorn is installed.
+"""
+import threading
+
+from gunicorn.workers.gthread import ThreadWorker
+
+
+class DrainingWorker(ThreadWorker):
+    """gthread worker that keeps serving while its tasks drain on SIGTERM.
+
+    Uploads get 503 during the drain, status and download requests are still
+    answered, and the worker keeps reporting to the master, so a drain is not
+    cut short by ``timeout`` when workers are replaced (HUP).
+    """
+
+    def handle_exit(self, sig, frame):
+        manager = self.wsgi.extensions['emailvalid']
+        if manager.draining:
+            return
+
+        def drain():
+            manager.drain()
+            self.alive = False
+        threading.Thread(target=drain, name='drain', daemon=True).start()
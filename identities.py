@@ -0,0 +1,164 @@
+"""Pool of outbound SMTP identities used for verification probes.
+
+An identity is a source address to bind, a HELO name and a MAIL FROM sender.
+They are configured as a list of objects in ``SMTP_IDENTITIES``::
+
+    [{"name": "ip1", "source_address": "192.0.2.10", "helo": "mx1.example.org",
+      "mail_from": "verify@example.org", "max_per_minute": 600}]
+
+``mail_from`` may contain ``{domain}``, replaced by the probed domain. Each
+session takes an identity for the MX host, either in turn (``round_robin``)
+or the one with the fewest recent blocks and sessions (``health``).
+Identities the MX refuses ``block_threshold`` times in a row cool off for
+that MX during ``cooldown`` seconds, and identities at their
+``max_per_minute`` are skipped. When no identity is ready for an MX, the
+session waits for the first one to be, so rate limits and cool-offs slow
+probing down; only a wait past its bound defers the probe.
+"""
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ('round_robin', 'health')
+
+# Enhanced status codes of policy rejections, e.g. "554 5.7.1 Client host blocked"
+_POLICY_STATUS = re.compile(r'5\.7\.\d+')
+
+
+def is_block(code: int, message=b'') -> bool:
+    """Whether an SMTP reply refuses the client itself rather than the mailbox"""
+    if code == 421:
+        return True
+    if isinstance(message, bytes):
+        message = message.decode('ascii', 'replace')
+    return code >= 500 and _POLICY_STATUS.match(message) is not None
+
+
+class Identity:
+    def __init__(self, name: str, source_address: str = None, helo: str = None,
+                 mail_from: str = 'verify@{domain}', max_per_minute: int = None):
+        self.name = name
+        self.source_address = source_address
+        self.helo = helo
+        self.mail_from = mail_from
+        self.max_per_minute = max_per_minute
+
+    @property
+    def bind_address(self):
+        """``source_address`` argument for smtplib (any local port)"""
+        return (self.source_address, 0) if self.source_address else None
+
+    def sender(self, domain: str) -> str:
+        return self.mail_from.format(domain=domain)
+
+
+class IdentityPool:
+    # Seconds of history used for rate accounting
+    WINDOW = 60
+
+    def __init__(self, identities: list = (), strategy: str = 'round_robin',
+                 cooldown: float = 300, block_threshold: int = 3):
+        if strategy not in STRATEGIES:
+            raise ValueError(f'Unknown identity strategy "{strategy}"')
+        self.identities = list(identities) or [Identity('default')]
+        self.strategy = strategy
+        self.cooldown = cooldown
+        self.block_threshold = block_threshold
+        self._recent = {identity.name: deque() for identity in self.identities}
+        self._blocks = {}
+        self._cooling = {}
+        self._turns = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'IdentityPool':
+        return cls(
+            [Identity(**identity) for identity in config['SMTP_IDENTITIES']],
+            config['IDENTITY_STRATEGY'], config['IDENTITY_COOLDOWN'], config['IDENTITY_BLOCK_THRESHOLD']
+        )
+
+    def acquire(self, mx_host: str, exclude=(), wait: float = 0):
+        """Identity for the next session to ``mx_host``.
+
+        Identities named in ``exclude`` are skipped. When every other identity
+        is cooling off for the MX or at its rate, wait up to ``wait`` seconds
+        for the first one to be ready; None is returned if none will be.
+        """
+        deadline = time.monotonic() + wait
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                candidates = [identity for identity in self.identities if identity.name not in exclude]
+                ready = [
+                    identity for identity in candidates
+                    if not self._is_cooling(identity, mx_host, now) and not self._at_rate(identity, now)
+                ]
+                if ready and self.strategy == 'health':
+                    identity = min(ready, key=lambda i: (
+                        self._blocks.get((i.name, mx_host), 0), len(self._recent[i.name])
+                    ))
+                elif ready:
+                    turn = self._turns.get(mx_host, 0)
+                    self._turns[mx_host] = turn + 1
+                    identity = ready[turn % len(ready)]
+                elif candidates:
+                    identity = None
+                    ready_at = min(self._ready_at(candidate, mx_host) for candidate in candidates)
+                else:
+                    return None
+                if identity is not None:
+                    self._recent[identity.name].append(now)
+                    return identity
+            if ready_at > deadline:
+                return None
+            # Other sessions may take the slot first; look again once it frees up
+            time.sleep(max(ready_at - now, 0.01))
+
+    def record(self, identity: Identity, mx_host: str, blocked: bool):
+        """Account the outcome of a session; repeated blocks start a cool-off"""
+        key = (identity.name, mx_host)
+        with self._lock:
+            if not blocked:
+                self._blocks.pop(key, None)
+                return
+            count = self._blocks.get(key, 0) + 1
+            if count < self.block_threshold:
+                self._blocks[key] = count
+                return
+            self._blocks.pop(key, None)
+            self._cooling[key] = time.monotonic() + self.cooldown
+        logger.warning(f"Identity {identity.name} blocked by {mx_host}, cooling off for {self.cooldown}s")
+
+    def cooling(self) -> int:
+        """Number of (identity, MX host) pairs currently cooling off"""
+        now = time.monotonic()
+        with self._lock:
+            return sum(1 for until in self._cooling.values() if until > now)
+
+    def _is_cooling(self, identity: Identity, mx_host: str, now: float) -> bool:
+        key = (identity.name, mx_host)
+        until = self._cooling.get(key)
+        if until is not None and until <= now:
+            del self._cooling[key]
+            until = None
+        return until is not None
+
+    def _ready_at(self, identity: Identity, mx_host: str) -> float:
+        """When the identity ends its cool-off and has a free slot in its rate window"""
+        ready_at = self._cooling.get((identity.name, mx_host), 0)
+        recent = self._recent[identity.name]
+        if identity.max_per_minute == 0:
+            return float('inf')
+        if identity.max_per_minute is not None and len(recent) >= identity.max_per_minute:
+            ready_at = max(ready_at, recent[len(recent) - identity.max_per_minute] + self.WINDOW)
+        return ready_at
+
+    def _at_rate(self, identity: Identity, now: float) -> bool:
+        recent = self._recent[identity.name]
+        while recent and now - recent[0] >= self.WINDOW:
+            recent.popleft()
+        return identity.max_per_minute is not None and len(recent) >= identity.max_per_minute
@@ -0,0 +1,122 @@
+"""Job records shared by the server processes of one host.
+
+A task runs in the process that accepted its upload, but with several server
+processes behind one address the status and download requests of that task
+may reach any of them. Each process publishes the state of its tasks to a
+SQLite file in the upload folder, which every process reads for the tasks it
+is not running itself. A task's result file is kept in the same folder, so
+any process can send it.
+
+Records of tasks that stopped being published while still pending or
+processing belong to a process that died; they are reported as failed.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+_COLUMNS = ('task_id', 'status', 'progress', 'error', 'total_rows', 'output_format',
+            'result_file', 'stats', 'owner', 'updated_at')
+
+
+class JobStore:
+    def __init__(self, path: str, stale_after: float = 60):
+        self.path = path
+        self.stale_after = stale_after
+        self._local = threading.local()
+        self._connect().execute(
+            'CREATE TABLE IF NOT EXISTS jobs (task_id TEXT PRIMARY KEY, status TEXT, '
+            'progress INTEGER, error TEXT, total_rows INTEGER, output_format TEXT, '
+            'result_file TEXT, stats TEXT, owner TEXT, updated_at REAL)'
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers in other processes run during writes
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def put(self, records: list):
+        """Insert or update records (dicts with the job columns).
+
+        The record of a completed or failed task is final: a snapshot of the
+        running task published concurrently never replaces it.
+        """
+        db = self._connect()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.executemany(
+                f"INSERT INTO jobs VALUES ({', '.join('?' * len(_COLUMNS))}) "
+                f"ON CONFLICT (task_id) DO UPDATE SET "
+                f"{', '.join(f'{column} = excluded.{column}' for column in _COLUMNS[1:])} "
+                f"WHERE jobs.status NOT IN ('completed', 'failed')",
+                [
+                    (record['task_id'], record['status'], record['progress'], record.get('error'),
+                     record['total_rows'], record['output_format'], record.get('result_file'),
+                     json.dumps(record.get('stats') or {}), record.get('owner'), now)
+                    for record in records
+                ]
+            )
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def get(self, task_id: str):
+        row = self._connect().execute('SELECT * FROM jobs WHERE task_id = ?', (task_id,)).fetchone()
+        return self._record(row) if row else None
+
+    def take(self, task_id: str):
+        """Remove and return the record of a completed task, so only one download gets it"""
+        db = self._connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute("SELECT * FROM jobs WHERE task_id = ? AND status = 'completed'",
+                             (task_id,)).fetchone()
+            if row:
+                db.execute('DELETE FROM jobs WHERE task_id = ?', (task_id,))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return self._record(row) if row else None
+
+    def delete(self, task_id: str):
+        self._connect().execute('DELETE FROM jobs WHERE task_id = ?', (task_id,))
+
+    def prune(self, max_age: float) -> int:
+        """Delete finished records older than ``max_age`` seconds with their result files"""
+        db = self._connect()
+        oldest = time.time() - max_age
+        rows = db.execute(
+            "SELECT task_id, result_file FROM jobs WHERE status IN ('completed', 'failed') AND updated_at < ?",
+            (oldest,)
+        ).fetchall()
+        for task_id, result_file in rows:
+            if result_file:
+                try:
+                    os.remove(result_file)
+                except FileNotFoundError:
+                    pass
+            db.execute('DELETE FROM jobs WHERE task_id = ?', (task_id,))
+        return len(rows)
+
+    def _record(self, row) -> dict:
+        record = dict(zip(_COLUMNS, row))
+        record['stats'] = json.loads(record['stats'])
+        if record['status'] in ('pending', 'processing') and time.time() - record['updated_at'] > self.stale_after:
+            record['status'] = 'failed'
+            record['error'] = 'The server process running the task stopped'
+        return record
+
+    def close(self):
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
@@ -0,0 +1,266 @@
+"""Minimal Prometheus-style metrics with per-thread sharding.
+
+Worker threads only ever touch their own shard, so recording a value is a
+dict update without any lock. Shards are summed when metrics are scraped,
+and shards of finished threads are folded into a retired total so the set of
+shards does not grow with every thread pool.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+# Latency buckets in seconds, from cache hits to SMTP timeouts
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class _Sharded:
+    """Base class keeping one dict of values per writer thread"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _collect(self) -> dict:
+        """Sum all shards into a dict keyed by label values"""
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    self._merge(self._retired, shard)
+            self._shards = live
+            total = self._copy(self._retired)
+            for _, shard in live:
+                self._merge(total, shard)
+        return total
+
+
+class Counter(_Sharded):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, *labels, amount: float = 1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def values(self) -> dict:
+        return self._collect()
+
+    def _merge(self, total: dict, shard: dict):
+        for labels, value in list(shard.items()):
+            total[labels] = total.get(labels, 0) + value
+
+    def _copy(self, values: dict) -> dict:
+        return dict(values)
+
+    def samples(self):
+        for labels, value in sorted(self.values().items()):
+            yield self.name + '_total', self.labelnames, labels, value
+
+
+class Histogram(_Sharded):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        shard = self._shard()
+        entry = shard.get(labels)
+        if entry is None:
+            # Per-bucket counts plus one overflow slot, then sum
+            entry = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def _merge(self, total: dict, shard: dict):
+        for labels, entry in list(shard.items()):
+            target = total.get(labels)
+            if target is None:
+                total[labels] = list(entry)
+            else:
+                for i, value in enumerate(entry):
+                    target[i] += value
+
+    def _copy(self, values: dict) -> dict:
+        return {labels: list(entry) for labels, entry in values.items()}
+
+    def samples(self):
+        labelnames = self.labelnames + ('le',)
+        for labels, entry in sorted(self._collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), entry[:-1]):
+                cumulative += count
+                yield self.name + '_bucket', labelnames, labels + (str(bound),), cumulative
+            yield self.name + '_sum', self.labelnames, labels, entry[-1]
+            yield self.name + '_count', self.labelnames, labels, cumulative
+
+
+class Gauge:
+    """Gauge whose value is computed by a callback at scrape time"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def samples(self):
+        yield self.name, (), (), self.callback()
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def expose(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labelnames, labels, value in metric.samples():
+                if labelnames:
+                    pairs = ','.join(
+                        f'{key}="{_escape(str(label))}"' for key, label in zip(labelnames, labels)
+                    )
+                    name = f'{name}{{{pairs}}}'
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class TaskStats:
+    """Per-task counters for /status, sharded per worker thread like metrics.
+
+    Keys are tuples such as ``('verdict', 'deliverable')`` or
+    ``('in_flight', 'smtp')``; in-flight stages are counted up on entry and
+    down on exit. The emails/s moving window is computed on the read side
+    from snapshots, so workers never wait for a status request.
+    """
+
+    # Seconds of history used for the emails/s moving window
+    WINDOW = 30
+
+    def __init__(self):
+        self._counter = Counter('task', 'Per-task statistics')
+        self._samples = deque()
+        self._samples_lock = threading.Lock()
+        self.started = time.monotonic()
+        self.finished = None
+
+    def finish(self):
+        """Freeze the throughput at the task average once validation is done"""
+        self.finished = time.monotonic()
+
+    def inc(self, *key, amount: float = 1):
+        self._counter.inc(*key, amount=amount)
+
+    def snapshot(self, total: int) -> dict:
+        values = self._counter.values()
+        grouped = {}
+        for key, value in values.items():
+            grouped.setdefault(key[0], {})[':'.join(key[1:])] = value
+
+        verdicts = grouped.get('verdict', {})
+        validated = int(sum(verdicts.values()))
+        reused = int(sum(grouped.get('reused', {}).values()))
+        now = time.monotonic()
+        with self._samples_lock:
+            self._samples.append((now, validated))
+            while len(self._samples) > 2 and now - self._samples[1][0] >= self.WINDOW:
+                self._samples.popleft()
+            since, validated_since = self._samples[0]
+        if self.finished is not None:
+            now, since, validated_since = self.finished, self.started, 0
+        elif now - since < 1:
+            # Not enough history yet: fall back to the task average
+            since, validated_since = self.started, 0
+        rate = (validated - validated_since) / (now - since) if now > since else 0.0
+        remaining = max(total - validated - reused, 0)
+
+        cache = {}
+        for key, count in grouped.get('cache', {}).items():
+            name, result = key.split(':')
+            cache.setdefault(name, {'hit': 0, 'miss': 0})[result] = count
+        return {
+            'validated': validated,
+            'reused': reused,
+            'emails_per_second': round(rate, 2),
+            'eta_seconds': round(remaining / rate) if rate and total else None,
+            'verdicts': verdicts,
+            'in_flight': {stage: int(n) for stage, n in grouped.get('in_flight', {}).items()},
+            'cache_hit_rate': {
+                name: round(c['hit'] / (c['hit'] + c['miss']), 3) if c['hit'] + c['miss'] else None
+                for name, c in cache.items()
+            },
+            'deferred': int(sum(grouped.get('deferred', {}).values())),
+            'retries': int(sum(grouped.get('retries', {}).values())),
+            'prefiltered': int(sum(grouped.get('prefiltered', {}).values())),
+        }
+
+
+# Distinct provider labels kept before new providers are reported as "other"
+MAX_PROVIDERS = 100
+_providers = set()
+
+
+def mx_provider(provider: str) -> str:
+    """Provider label (see ProviderRegistry.provider), limited to MAX_PROVIDERS distinct values"""
+    if provider != 'none' and provider not in _providers:
+        # The long tail of self-hosted domains would explode the label set
+        if len(_providers) >= MAX_PROVIDERS:
+            return 'other'
+        _providers.add(provider)
+    return provider
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    'emailvalid_stage_seconds', 'Time spent in each validation stage', ('stage',)
+))
+PROVIDER_SECONDS = registry.register(Histogram(
+    'emailvalid_mx_provider_seconds', 'SMTP probe time per MX provider', ('provider',)
+))
+SMTP_RESPONSES = registry.register(Counter(
+    'emailvalid_smtp_responses', 'SMTP RCPT response codes', ('code',)
+))
+CACHE_LOOKUPS = registry.register(Counter(
+    'emailvalid_cache_lookups', 'Cache lookups by cache and result', ('cache', 'result')
+))
+EMAILS_VALIDATED = registry.register(Counter(
+    'emailvalid_emails_validated', 'Emails validated', ('outcome',)
+))
+IDENTITY_SESSIONS = registry.register(Counter(
+    'emailvalid_identity_sessions', 'SMTP sessions per outbound identity and outcome', ('identity', 'outcome')
+))
@@ -0,0 +1,113 @@
+"""Provider policies keyed by MX host name patterns.
+
+A rules file is a JSON list of objects such as::
+
+    {"name": "google", "patterns": ["*.google.com"], "behavior": "probe",
+     "catch_all": false, "helo": "mail.example.org", "max_concurrency": 10}
+
+``behavior`` is one of:
+
+- ``probe``: regular RCPT probing (the default)
+- ``accept_all``: the provider answers 250 to every RCPT, so probing tells
+  nothing; the domain is reported as catch-all without connecting
+- ``reject_probes``: the provider blocks verification probes; SMTP is skipped
+
+``catch_all`` (true/false) skips the catch-all probe when the answer is
+known, ``helo`` overrides the HELO name and ``max_concurrency`` caps the
+number of simultaneous SMTP sessions to the provider.
+
+Metrics and domain reports group MX hosts by provider: the name of the
+policy matching the host, else its registered domain (``example.co.uk`` for
+``mx1.example.co.uk``).
+"""
+import json
+import logging
+import threading
+from fnmatch import fnmatch
+
+logger = logging.getLogger(__name__)
+
+BEHAVIORS = ('probe', 'accept_all', 'reject_probes')
+
+# Second-level labels under which country-code domains are registered (co.uk, com.au, ne.jp)
+_SECOND_LEVEL = frozenset(('ac', 'co', 'com', 'edu', 'gov', 'ne', 'net', 'or', 'org'))
+
+
+def registered_domain(mx_host: str) -> str:
+    """Domain an MX host belongs to: its last two labels, or three under a ccTLD second level"""
+    labels = mx_host.rstrip('.').lower().split('.')
+    if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in _SECOND_LEVEL:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+
+class ProviderPolicy:
+    def __init__(self, name: str, patterns: list, behavior: str = 'probe', catch_all: bool = None,
+                 helo: str = None, max_concurrency: int = None):
+        if behavior not in BEHAVIORS:
+            raise ValueError(f'Unknown provider behavior "{behavior}" for {name}')
+        self.name = name
+        self.patterns = [pattern.lower().rstrip('.') for pattern in patterns]
+        self.behavior = behavior
+        self.catch_all = catch_all
+        self.helo = helo
+        self.max_concurrency = max_concurrency
+        self.semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+
+    def matches(self, mx_host: str) -> bool:
+        return any(fnmatch(mx_host, pattern) for pattern in self.patterns)
+
+    def session(self):
+        """Context manager holding one of the provider's concurrency slots"""
+        return self.semaphore if self.semaphore is not None else _NO_LIMIT
+
+
+class _NoLimit:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_LIMIT = _NoLimit()
+
+# Policy for MX hosts no rule matches
+DEFAULT_POLICY = ProviderPolicy('default', ['*'])
+
+
+class ProviderRegistry:
+    """First matching policy wins; lookups are memoized per MX host"""
+
+    def __init__(self, policies: list = ()):
+        self.policies = list(policies)
+        self._matches = {}
+
+    @classmethod
+    def load(cls, path: str) -> 'ProviderRegistry':
+        try:
+            with open(path) as f:
+                rules = json.load(f)
+        except FileNotFoundError:
+            logger.warning("Provider rules file not found")
+            return cls()
+        return cls(ProviderPolicy(**rule) for rule in rules)
+
+    def match(self, mx_host: str) -> ProviderPolicy:
+        if not mx_host:
+            return DEFAULT_POLICY
+        host = mx_host.lower().rstrip('.')
+        policy = self._matches.get(host)
+        if policy is None:
+            policy = next((p for p in self.policies if p.matches(host)), DEFAULT_POLICY)
+            self._matches[host] = policy
+        return policy
+
+    def provider(self, mx_host: str) -> str:
+        """Provider label of an MX host: its policy name, else its registered domain, or 'none'"""
+        if not mx_host:
+            return 'none'
+        policy = self.match(mx_host)
+        if policy is not DEFAULT_POLICY:
+            return policy.name
+        return registered_domain(mx_host)
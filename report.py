@@ -0,0 +1,129 @@
+"""Per-domain and per-MX-provider aggregates of a task's results.
+
+Results are counted as they are produced, so the report is ready when the
+task ends without reading the result file again. Domains are grouped by MX
+provider: the name of the provider policy matching their MX host (``google``
+for ``alt1.aspmx.l.google.com``), else the host's registered domain
+(``example.co.uk``). Verdicts reused from verdict indexes written before MX
+hosts were stored count under the ``none`` provider, without a code.
+Addresses with invalid syntax have no domain to speak of; they are counted
+in one row with an empty domain.
+"""
+import csv
+import io
+import threading
+
+from providers import ProviderRegistry
+
+# Domain row of the addresses with invalid syntax
+INVALID_DOMAIN = ''
+
+# Counted fields of a domain or provider row, in report order
+FIELDS = ('emails', 'valid', 'catch_all', 'disposable', 'role', 'invalid_syntax', 'invalid_domain', 'deferred')
+
+
+class _Aggregate:
+    __slots__ = ('counts', 'smtp_codes', 'mx_provider')
+
+    def __init__(self):
+        self.counts = dict.fromkeys(FIELDS, 0)
+        self.smtp_codes = {}
+        self.mx_provider = None
+
+    def add(self, result: dict):
+        counts = self.counts
+        counts['emails'] += 1
+        counts['valid'] += result['smtp_valid']
+        counts['catch_all'] += result['is_catch_all']
+        counts['disposable'] += result['is_disposable']
+        counts['role'] += result['is_role']
+        counts['invalid_syntax'] += not result['syntax_valid']
+        counts['invalid_domain'] += result['syntax_valid'] and not result['is_disposable'] \
+            and not result['domain_valid']
+        counts['deferred'] += result.get('deferred', False)
+        code = result.get('smtp_code')
+        if code is not None:
+            code = str(code)
+            self.smtp_codes[code] = self.smtp_codes.get(code, 0) + 1
+
+    def row(self) -> dict:
+        # Deferred addresses got no SMTP answer, valid or not
+        answered = self.counts['emails'] - self.counts['deferred']
+        return {
+            **self.counts,
+            'valid_ratio': round(self.counts['valid'] / answered, 4) if answered else None,
+            'smtp_codes': dict(sorted(self.smtp_codes.items())),
+        }
+
+
+class DomainReport:
+    """Streaming counters keyed by recipient domain and by MX provider"""
+
+    def __init__(self, providers: ProviderRegistry = None):
+        self.providers = providers or ProviderRegistry()
+        self._domains = {}
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    def add(self, result: dict):
+        if result['syntax_valid']:
+            domain = result['email'].rpartition('@')[2].strip().lower()
+        else:
+            # What follows an '@' in an invalid address is not a domain
+            domain = INVALID_DOMAIN
+        provider = self.providers.provider(result.get('mx_host'))
+        with self._lock:
+            aggregate = self._domains.get(domain)
+            if aggregate is None:
+                aggregate = self._domains[domain] = _Aggregate()
+            aggregate.add(result)
+            if aggregate.mx_provider is None or aggregate.mx_provider == 'none':
+                aggregate.mx_provider = provider
+            aggregate = self._providers.get(provider)
+            if aggregate is None:
+                aggregate = self._providers[provider] = _Aggregate()
+            aggregate.add(result)
+
+    def to_dict(self) -> dict:
+        """Domain and provider rows, largest first"""
+        with self._lock:
+            domains = [
+                {'domain': domain, 'mx_provider': aggregate.mx_provider, **aggregate.row()}
+                for domain, aggregate in self._domains.items()
+            ]
+            # A domain counts under the provider of its first resolved MX
+            provider_domains = {}
+            for aggregate in self._domains.values():
+                provider_domains[aggregate.mx_provider] = provider_domains.get(aggregate.mx_provider, 0) + 1
+            providers = [
+                {'mx_provider': provider, 'domains': provider_domains.get(provider, 0), **aggregate.row()}
+                for provider, aggregate in self._providers.items()
+            ]
+        domains.sort(key=lambda row: (-row['emails'], row['domain']))
+        providers.sort(key=lambda row: (-row['emails'], row['mx_provider']))
+        return {
+            'emails': sum(row['emails'] for row in domains),
+            'domains': domains,
+            'providers': providers,
+        }
+
+
+def report_csv(report: dict, by: str = 'domain') -> str:
+    """One CSV table of a report dict, by 'domain' or 'provider'"""
+    if by == 'domain':
+        columns = ('domain', 'mx_provider', *FIELDS, 'valid_ratio', 'smtp_codes')
+        rows = report['domains']
+    elif by == 'provider':
+        columns = ('mx_provider', 'domains', *FIELDS, 'valid_ratio', 'smtp_codes')
+        rows = report['providers']
+    else:
+        raise ValueError(f'Unknown report grouping "{by}"')
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(columns)
+    for row in rows:
+        values = [row[column] for column in columns[:-1]]
+        # e.g. "250=120 550=8"
+        values.append(' '.join(f'{code}={count}' for code, count in row['smtp_codes'].items()))
+        writer.writerow(values)
+    return output.getvalue()
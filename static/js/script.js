@@ -12,6 +12,14 @@ document.getElementById('csvFile').addEventListener('change', function (e) {
     fileName.textContent = file.name;
     fileName.classList.add('show');
 
+    // Compressed and binary formats cannot be previewed in the browser
+    if (!/\.(csv|tsv|tab)$/i.test(file.name)) {
+        showColumnInput(true);
+        document.getElementById('mappingSection').classList.remove('hidden');
+        return;
+    }
+    showColumnInput(false);
+
     Papa.parse(file, {
         preview: 1,
         complete: function (results) {
@@ -55,10 +63,24 @@ function updateColumnSelector(headers = []) {
     }
 }
 
+function showColumnInput(show) {
+    document.getElementById('columnInput').classList.toggle('hidden', !show);
+    document.getElementById('columnSelect').classList.toggle('hidden', show);
+    document.getElementById('columnHelp').textContent = show
+        ? "Enter the name (or index, without headers) of the email column"
+        : "";
+}
+
 function startValidation() {
     const file = document.getElementById('csvFile').files[0];
-    const emailColumn = document.getElementById('columnSelect').value;
+    const columnInput = document.getElementById('columnInput');
+    const emailColumn = columnInput.classList.contains('hidden')
+        ? document.getElementById('columnSelect').value
+        : columnInput.value.trim();
     const hasHeaders = document.getElementById('hasHeaders').checked;
+    const outputFormat = document.getElementById('outputFormat').value;
+    const keepOriginal = document.getElementById('keepOriginal').checked;
+    const baseTaskId = document.getElementById('baseTaskId').value.trim();
 
     if (!file) {
         showError('Please select a CSV file first');
@@ -72,6 +94,11 @@ function startValidation() {
     formData.append('file', file);
     formData.append('email_column', emailColumn);
     formData.append('has_headers', hasHeaders.toString());
+    formData.append('output_format', outputFormat);
+    formData.append('keep_original', keepOriginal.toString());
+    if (baseTaskId) {
+        formData.append('base_task_id', baseTaskId);
+    }
 
     fetch('/upload', {
         method: 'POST',
@@ -161,6 +188,8 @@ function showProgress() {
 function showDownloadButton(taskId) {
     const downloadLink = document.getElementById('downloadLink');
     downloadLink.href = `/download/${taskId}`;
+    document.getElementById('taskIdText').textContent = taskId;
+    document.getElementById('reportLink').href = `/report/${taskId}?format=csv`;
     document.getElementById('downloadSection').classList.remove('hidden');
 }
 
@@ -0,0 +1,159 @@
+import json
+import multiprocessing
+import threading
+import time
+from urllib import error, request
+
+import pytest
+
+from distributed import Coordinator, run_worker
+from validator import EmailValidator
+
+
+def emails(count: int) -> list:
+    # Several domains, one of them larger than a chunk, so its parts share an owner
+    return [f'user{i}@{"big.example" if i % 3 == 0 else f"d{i % 7}.example"}' for i in range(count)]
+
+
+@pytest.fixture
+def coordinator():
+    coordinator = Coordinator(chunk_size=20, lease_timeout=1).start()
+    yield coordinator
+    coordinator.stop()
+
+
+@pytest.fixture
+def start_workers(coordinator):
+    context = multiprocessing.get_context('spawn')
+    workers = []
+
+    def start(count: int):
+        for i in range(count):
+            worker = context.Process(
+                target=run_worker, args=(coordinator.url, f'worker-{i}'),
+                kwargs={'engine': 'syntax', 'concurrency': 4, 'poll_interval': 0.05, 'give_up_after': 5,
+                        'token': coordinator.token},
+                daemon=True
+            )
+            worker.start()
+            workers.append(worker)
+        deadline = time.monotonic() + 60
+        while len(coordinator.status()['workers']) < len(workers):
+            assert time.monotonic() < deadline, 'workers did not start'
+            time.sleep(0.05)
+
+    yield start
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        worker.join()
+
+
+def post(url: str, payload: dict, token: str) -> int:
+    req = request.Request(url, data=json.dumps(payload).encode(), headers={
+        'Content-Type': 'application/json', 'Authorization': f'Bearer {token}'
+    })
+    try:
+        with request.urlopen(req, timeout=10) as response:
+            return response.status
+    except error.HTTPError as e:
+        return e.code
+
+
+def test_two_workers_keep_input_order(coordinator, start_workers):
+    start_workers(2)
+    addresses = emails(200) + ['not-an-email']
+    job = coordinator.submit(addresses)
+    results = job.wait(timeout=60)
+    assert [result['email'] for result in results] == addresses
+    assert all(result['syntax_valid'] for result in results[:-1])
+    assert not results[-1]['syntax_valid']
+    assert {chunk.worker for chunk in job.chunks} <= {'worker-0', 'worker-1'}
+    # Every part of the domain too large for one chunk went to the same worker
+    assert len({chunk.worker for chunk in job.chunks if chunk.affinity == 'big.example'}) == 1
+
+
+def test_expired_lease_is_handed_out_again(coordinator, start_workers):
+    addresses = emails(100)
+    job = coordinator.submit(addresses)
+    # A worker that takes a chunk and never returns it
+    lease = coordinator.lease('lost')
+    start_workers(2)
+    results = job.wait(timeout=60)
+    assert [result['email'] for result in results] == addresses
+    chunk = job.chunks[lease['chunk_id']]
+    assert chunk.done
+    assert chunk.worker in ('worker-0', 'worker-1')
+
+
+def test_complete_refuses_results_not_matching_the_chunk(coordinator):
+    job = coordinator.submit(emails(10))
+    lease = coordinator.lease('w')
+    body = {'worker': 'w', 'job_id': lease['job_id'], 'chunk_id': lease['chunk_id']}
+    complete = f'{coordinator.url}/complete'
+    result = {
+        'email': lease['emails'][0], 'syntax_valid': True, 'domain_valid': False, 'smtp_valid': False,
+        'is_disposable': False, 'is_role': False, 'is_catch_all': False, 'errors': [],
+    }
+    assert post(complete, {**body, 'results': [{}] * len(lease['emails'])}, coordinator.token) == 400
+    assert post(complete, {**body, 'results': [result] * len(lease['emails'])}, coordinator.token) == 400
+    assert post(complete, {**body, 'results': 'ok'}, coordinator.token) == 400
+    assert not job.chunks[lease['chunk_id']].done
+
+    results = [{**result, 'email': email} for email in lease['emails']]
+    assert post(complete, {**body, 'results': results}, coordinator.token) == 200
+    assert job.chunks[lease['chunk_id']].done
+
+
+def test_job_without_workers_times_out(coordinator):
+    job = coordinator.submit(emails(10))
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        job.wait(idle_timeout=1)
+    assert time.monotonic() - started < 10
+
+
+def test_lease_renewed_while_a_slow_chunk_is_validated(monkeypatch):
+    validate = EmailValidator.validate
+
+    def slow_validate(self, email):
+        time.sleep(0.05)
+        return validate(self, email)
+
+    monkeypatch.setattr(EmailValidator, 'validate', slow_validate)
+    coordinator = Coordinator(chunk_size=10, lease_timeout=0.3).start()
+    leases = []
+    lease = coordinator.lease
+    monkeypatch.setattr(coordinator, 'lease', lambda worker: leases.append(lease(worker)) or leases[-1])
+    # One domain in 3 chunks; each chunk takes about 0.5 s, longer than the lease
+    addresses = [f'user{i}@big.example' for i in range(30)]
+    job = coordinator.submit(addresses)
+    workers = [
+        threading.Thread(target=run_worker, args=(coordinator.url, f'worker-{i}'), daemon=True,
+                         kwargs={'engine': 'syntax', 'concurrency': 1, 'poll_interval': 0.05,
+                                 'give_up_after': 0.5, 'token': coordinator.token})
+        for i in range(2)
+    ]
+    try:
+        for worker in workers:
+            worker.start()
+        results = job.wait(timeout=30, idle_timeout=1)
+    finally:
+        coordinator.stop()
+    for worker in workers:
+        worker.join(10)
+    assert [result['email'] for result in results] == addresses
+    # Every chunk was leased once, all to the worker owning the domain
+    assert sorted(lease['chunk_id'] for lease in leases if lease) == [0, 1, 2]
+    assert len({chunk.worker for chunk in job.chunks}) == 1
+
+
+def test_requests_without_the_token_are_refused(coordinator):
+    job = coordinator.submit(emails(10))
+    assert post(f'{coordinator.url}/lease', {'worker': 'w'}, 'wrong') == 401
+    req = request.Request(f'{coordinator.url}/status')
+    with pytest.raises(error.HTTPError) as refused:
+        request.urlopen(req, timeout=10)
+    assert refused.value.code == 401
+    assert not any(chunk.worker for chunk in job.chunks)
+    assert post(f'{coordinator.url}/lease', {'worker': 'w'}, coordinator.token) == 200
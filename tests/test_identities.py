@@ -0,0 +1,115 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.fake_smtp import FakeSMTPServer
+from identities import Identity, IdentityPool
+from validator import EmailValidator
+
+
+def pool(*identities, **kwargs) -> IdentityPool:
+    pool = IdentityPool(identities, **kwargs)
+    # A short rate window keeps the tests fast
+    pool.WINDOW = 0.3
+    return pool
+
+
+def test_round_robin_takes_identities_in_turn():
+    identities = pool(Identity('a'), Identity('b'))
+    assert [identities.acquire('mx').name for _ in range(4)] == ['a', 'b', 'a', 'b']
+
+
+def test_rate_window_waits_for_a_free_slot():
+    identities = pool(Identity('a', max_per_minute=2))
+    assert identities.acquire('mx').name == 'a'
+    assert identities.acquire('mx').name == 'a'
+    assert identities.acquire('mx') is None
+
+    started = time.monotonic()
+    assert identities.acquire('mx', wait=5).name == 'a'
+    assert 0.2 < time.monotonic() - started < 2
+
+
+def test_rate_limited_identity_is_skipped_for_a_ready_one():
+    identities = pool(Identity('a', max_per_minute=1), Identity('b'))
+    assert [identities.acquire('mx').name for _ in range(3)] == ['a', 'b', 'b']
+
+
+def test_wait_shorter_than_the_rate_window_gives_up():
+    identities = pool(Identity('a', max_per_minute=1))
+    identities.WINDOW = 60
+    identities.acquire('mx')
+    started = time.monotonic()
+    assert identities.acquire('mx', wait=0.2) is None
+    assert time.monotonic() - started < 0.1
+
+
+def test_cool_off_after_consecutive_blocks():
+    identities = pool(Identity('a'), block_threshold=2, cooldown=0.3)
+    identity = identities.acquire('mx')
+    identities.record(identity, 'mx', blocked=True)
+    assert identities.acquire('mx') is not None
+    identities.record(identity, 'mx', blocked=True)
+    assert identities.cooling() == 1
+    assert identities.acquire('mx') is None
+    # The cool-off is per MX host
+    assert identities.acquire('other-mx').name == 'a'
+
+    started = time.monotonic()
+    assert identities.acquire('mx', wait=5).name == 'a'
+    assert 0.2 < time.monotonic() - started < 2
+    assert identities.cooling() == 0
+
+
+def test_success_resets_the_block_count():
+    identities = pool(Identity('a'), block_threshold=2)
+    identity = identities.acquire('mx')
+    identities.record(identity, 'mx', blocked=True)
+    identities.record(identity, 'mx', blocked=False)
+    identities.record(identity, 'mx', blocked=True)
+    assert identities.cooling() == 0
+
+
+def test_retry_excludes_the_identities_tried():
+    identities = pool(Identity('a'), Identity('b'))
+    assert identities.acquire('mx', exclude=['a']).name == 'b'
+    # Nothing else to wait for
+    started = time.monotonic()
+    assert identities.acquire('mx', exclude=['a', 'b'], wait=5) is None
+    assert time.monotonic() - started < 0.1
+
+
+@pytest.fixture
+def smtp_server():
+    server = FakeSMTPServer(('127.0.0.1', 0), catch_all_ratio=0, greylist_ratio=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def validate_all(identities, port: int, max_wait: float, monkeypatch) -> list:
+    monkeypatch.setattr(EmailValidator, '_identities', identities)
+    monkeypatch.setattr(EmailValidator, '_catch_all_cache', {})
+    validator = EmailValidator({'SMTP_PORT': port, 'IDENTITY_MAX_WAIT': max_wait})
+    monkeypatch.setattr(validator, 'resolve_mx', lambda domain: '127.0.0.1')
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        return list(executor.map(validator.validate, [f'user{i}@example.com' for i in range(20)]))
+
+
+def test_rate_limit_slows_probing_down(smtp_server, monkeypatch):
+    identities = pool(Identity('only', max_per_minute=5))
+    results = validate_all(identities, smtp_server.server_address[1], 30, monkeypatch)
+    assert [EmailValidator.verdict(result) for result in results] == ['deliverable'] * 20
+
+
+def test_probe_deferred_past_the_wait(smtp_server, monkeypatch):
+    identities = pool(Identity('only', max_per_minute=5))
+    identities.WINDOW = 60
+    results = validate_all(identities, smtp_server.server_address[1], 0, monkeypatch)
+    verdicts = [EmailValidator.verdict(result) for result in results]
+    assert verdicts.count('deliverable') == 5
+    assert verdicts.count('deferred') == 15
+    assert 'undeliverable' not in verdicts
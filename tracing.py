@@ -0,0 +1,106 @@
+"""Per-email step tracing and a sampling profiler for running tasks."""
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+
+class Trace:
+    """Timestamps (ms since the start of validation) of each step for one email"""
+
+    def __init__(self, email: str, task_id: str = None):
+        self.email = email
+        self.task_id = task_id
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.events = []
+        self.duration = None
+
+    def mark(self, event: str, detail=None):
+        elapsed = round((time.perf_counter() - self.started) * 1000, 3)
+        self.events.append((elapsed, event, detail))
+
+    def finish(self) -> float:
+        self.duration = time.perf_counter() - self.started
+        return self.duration
+
+    def to_dict(self) -> dict:
+        return {
+            'email': self.email,
+            'task_id': self.task_id,
+            'started': self.wall_started,
+            'duration_ms': round(self.duration * 1000, 3) if self.duration is not None else None,
+            'events': [
+                {'ms': elapsed, 'event': event, 'detail': detail}
+                for elapsed, event, detail in self.events
+            ],
+        }
+
+
+class SlowTraceLog:
+    """Ring buffer of the most recent traces slower than the threshold"""
+
+    def __init__(self, size: int = 200):
+        self._traces = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def resize(self, size: int):
+        with self._lock:
+            if size != self._traces.maxlen:
+                self._traces = deque(self._traces, maxlen=size)
+
+    def add(self, trace: Trace):
+        with self._lock:
+            self._traces.append(trace)
+
+    def list(self, task_id: str = None) -> list:
+        with self._lock:
+            traces = list(self._traces)
+        return [
+            trace.to_dict() for trace in reversed(traces)
+            if task_id is None or trace.task_id == task_id
+        ]
+
+
+slow_traces = SlowTraceLog()
+
+
+class SamplingProfiler:
+    """Samples the stacks of matching threads at a fixed interval.
+
+    The result is written in the folded format read by flamegraph.pl,
+    speedscope and similar tools: one ``frame;frame;frame count`` line per
+    distinct stack, root first.
+    """
+
+    def __init__(self, thread_prefix: str, interval: float = 0.005):
+        self.thread_prefix = thread_prefix
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+
+    def run(self, seconds: float):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {
+                thread.ident: thread.name for thread in threading.enumerate()
+                if thread.name.startswith(self.thread_prefix)
+            }
+            for ident, frame in sys._current_frames().items():
+                if ident in names and ident != own_id:
+                    self.stacks[self._fold(frame)] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _fold(frame) -> str:
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(frames))
+
+    def folded(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
@@ -0,0 +1,512 @@
+"""Email validation engine shared by the web app and the command line.
+
+This module must not import Flask, so batch workers and the CLI can use the
+engine without loading the web stack. dnspython and smtplib are imported on
+first use and the disposable domain list and provider rules are loaded on the
+first validation, so importing the module and creating a validator are cheap.
+"""
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+
+from identities import IdentityPool, is_block
+from metrics import (
+    CACHE_LOOKUPS, EMAILS_VALIDATED, IDENTITY_SESSIONS, PROVIDER_SECONDS, SMTP_RESPONSES,
+    STAGE_SECONDS, TaskStats, mx_provider
+)
+from providers import DEFAULT_POLICY, ProviderPolicy, ProviderRegistry
+from tracing import Trace, slow_traces
+
+logger = logging.getLogger(__name__)
+
+# Engine settings; the web app keeps its own copy in app.config
+DEFAULT_CONFIG = {
+    'DISPOSABLE_DOMAINS_PATH': 'disposable_domains.txt',
+    'PROVIDER_RULES_PATH': 'provider_rules.json',
+    'ROLE_PREFIXES': ['admin', 'support', 'info', 'sales', 'contact'],
+    'CACHE_TIMEOUT': 3600,
+    'DNS_SERVERS': ['8.8.8.8', '8.8.4.4'],
+    'DNS_PORT': 53,
+    'SMTP_PORT': 25,
+    'SMTP_TIMEOUT': 10,
+    'SMTP_HELO': 'example.com',
+    # Outbound identities (see identities.py); empty means the host default
+    'SMTP_IDENTITIES': [],
+    'IDENTITY_STRATEGY': 'round_robin',
+    'IDENTITY_COOLDOWN': 300,
+    'IDENTITY_BLOCK_THRESHOLD': 3,
+    # Longest wait for a ready identity before a probe is deferred (longer than the cool-off)
+    'IDENTITY_MAX_WAIT': 360,
+    'TRACE_ENABLED': False,
+    'TRACE_SLOW_SECONDS': 5.0,
+    # Bloom filter of known-bad addresses and dead domains (see bloom.py); None disables it
+    'PREFILTER_PATH': None,
+    'PREFILTER_CAPACITY': 10_000_000,
+    'PREFILTER_ERROR_RATE': 1e-6,
+    'PREFILTER_LEARN': True,
+}
+
+# RCPT replies meaning the mailbox does not exist (policy blocks are excluded)
+KNOWN_BAD_CODES = (550, 551, 553)
+
+# Check depth: each engine runs the checks of the previous one
+ENGINES = ('syntax', 'dns', 'smtp')
+
+
+class ProbeDeferred(Exception):
+    """No outbound identity is ready for the MX host; the probe was not sent"""
+
+
+_smtp_class = None
+
+
+def _traced_smtp():
+    """SMTP client class that marks the TCP connect separately from the banner.
+
+    Built on first use so that importing this module does not import smtplib.
+    """
+    global _smtp_class
+    if _smtp_class is None:
+        import smtplib
+
+        class _TracedSMTP(smtplib.SMTP):
+            def __init__(self, trace: Trace = None, **kwargs):
+                self.trace = trace
+                super().__init__(**kwargs)
+
+            def _get_socket(self, host, port, timeout):
+                sock = super()._get_socket(host, port, timeout)
+                if self.trace is not None:
+                    self.trace.mark('connect', f'{host}:{port}')
+                return sock
+
+        _smtp_class = _TracedSMTP
+    return _smtp_class
+
+
+class EmailValidator:
+    # Shared resources with thread-safe access
+    EMAIL_REGEX = re.compile(r'^[\w\.\+\-]+\@[a-zA-Z0-9\-]+\.[a-zA-Z0-9\-\.]+$')
+    _disposable_domains = None
+    _providers = None
+    _identities = None
+    _prefilter = None
+    _domain_cache = {}
+    _catch_all_cache = {}
+    _cache_lock = threading.Lock()
+    _catch_all_lock = threading.Lock()
+    _load_lock = threading.Lock()
+
+    def __init__(self, config: dict = None, stats: TaskStats = None, trace: bool = False,
+                 task_id: str = None, engine: str = 'smtp'):
+        if engine not in ENGINES:
+            raise ValueError(f'Unknown engine "{engine}"')
+        self.config = {**DEFAULT_CONFIG, **(config or {})}
+        self.engine = engine
+        self.stats = stats or TaskStats()
+        self.trace_enabled = trace or self.config['TRACE_ENABLED']
+        self.task_id = task_id
+        self._local = threading.local()
+        self._resolver = None
+
+    @property
+    def resolver(self):
+        """DNS resolver, created on the first lookup"""
+        if self._resolver is None:
+            import dns.resolver
+            # The nameservers are set explicitly, so skip reading resolv.conf
+            resolver = dns.resolver.Resolver(configure=False)
+            resolver.nameservers = self.config['DNS_SERVERS']
+            resolver.port = self.config['DNS_PORT']
+            self._resolver = resolver
+        return self._resolver
+
+    @property
+    def providers(self) -> ProviderRegistry:
+        """Provider policies, loaded once on first use"""
+        if self.__class__._providers is None:
+            with self._load_lock:
+                if self.__class__._providers is None:
+                    self.__class__._providers = ProviderRegistry.load(self.config['PROVIDER_RULES_PATH'])
+        return self.__class__._providers
+
+    @property
+    def identities(self) -> IdentityPool:
+        """Outbound identity pool, shared by all validators"""
+        if self.__class__._identities is None:
+            with self._load_lock:
+                if self.__class__._identities is None:
+                    self.__class__._identities = IdentityPool.from_config(self.config)
+        return self.__class__._identities
+
+    @property
+    def prefilter(self):
+        """Known-bad filter loaded from PREFILTER_PATH, or None when disabled"""
+        if self.__class__._prefilter is None and self.config['PREFILTER_PATH']:
+            with self._load_lock:
+                if self.__class__._prefilter is None:
+                    from bloom import KnownBad
+                    self.__class__._prefilter = KnownBad.load(
+                        self.config['PREFILTER_PATH'], self.config['PREFILTER_CAPACITY'],
+                        self.config['PREFILTER_ERROR_RATE']
+                    )
+        return self.__class__._prefilter
+
+    @property
+    def disposable_domains(self) -> set:
+        """Disposable domains, loaded once on first use"""
+        if self.__class__._disposable_domains is None:
+            with self._load_lock:
+                if self.__class__._disposable_domains is None:
+                    self.__class__._disposable_domains = self._read_disposable_domains()
+        return self.__class__._disposable_domains
+
+    def _read_disposable_domains(self) -> set:
+        try:
+            with open(self.config['DISPOSABLE_DOMAINS_PATH']) as f:
+                return {line.strip() for line in f}
+        except FileNotFoundError:
+            logger.warning("Disposable domains file not found")
+            return set()
+
+    def validate(self, email: str) -> dict:
+        """Validate email with optimized checks and early exits"""
+        started = time.perf_counter()
+        if self.trace_enabled:
+            self._local.trace = Trace(email, self.task_id)
+        result = {
+            'email': email,
+            'syntax_valid': False,
+            'domain_valid': False,
+            'smtp_valid': False,
+            'is_disposable': False,
+            'is_role': False,
+            'is_catch_all': False,
+            'errors': [],
+            # 'email' or 'domain' when the result is definite enough for the pre-filter
+            'known_bad': None,
+            # True when the pre-filter rejected the address, so it is not learned again
+            'prefiltered': False,
+            # True when no outbound identity was ready in time, so SMTP gave no answer
+            'deferred': False,
+            # Kept for the domain report; not part of the result columns
+            'mx_host': None,
+            'smtp_code': None
+        }
+
+        try:
+            # Known-bad addresses and dead domains are rejected before anything else
+            prefilter = self.prefilter
+            if prefilter is not None:
+                known_bad = prefilter.check(email)
+                if known_bad is not None:
+                    result['syntax_valid'] = True
+                    result['domain_valid'] = known_bad == 'email'
+                    result['known_bad'] = known_bad
+                    result['prefiltered'] = True
+                    result['errors'].append(
+                        'Known invalid address' if known_bad == 'email' else 'Known dead domain'
+                    )
+                    self.stats.inc('prefiltered')
+                    return result
+
+            # Fast syntax validation
+            syntax_valid = self.EMAIL_REGEX.match(email)
+            STAGE_SECONDS.observe(time.perf_counter() - started, 'syntax')
+            if not syntax_valid:
+                raise ValueError("Invalid email syntax")
+            
+            result['syntax_valid'] = True
+            local_part, domain = email.split('@', 1)
+
+            # Early exit for disposable domains
+            if domain in self.disposable_domains:
+                result['is_disposable'] = True
+                return result
+
+            # Role-based account detection
+            result['is_role'] = any(
+                local_part.lower().startswith(prefix)
+                for prefix in self.config['ROLE_PREFIXES']
+            )
+            if self.engine == 'syntax':
+                return result
+
+            # Domain validation with caching
+            mx_host = self.resolve_mx(domain)
+            result['mx_host'] = mx_host
+            result['domain_valid'] = mx_host is not None
+            if not result['domain_valid']:
+                if self.is_dead_domain(domain):
+                    result['known_bad'] = 'domain'
+                raise ValueError("Domain validation failed")
+            if self.engine == 'dns':
+                return result
+
+            # Known provider behavior short-cuts useless probes
+            policy = self.providers.match(mx_host)
+            if policy.behavior == 'accept_all':
+                result['smtp_valid'] = True
+                result['is_catch_all'] = True
+                return result
+            if policy.behavior == 'reject_probes':
+                raise ValueError(f"SMTP probe skipped: {policy.name} blocks verification probes")
+
+            is_catch_all = policy.catch_all
+            if is_catch_all is None:
+                is_catch_all = self._cached_catch_all(domain)
+
+            # SMTP validation, probing catch-all status in the same session if unknown
+            catch_all_probe = self._catch_all_address(domain) if is_catch_all is None else None
+            result['smtp_valid'] = self.check_smtp(email, domain, policy, catch_all_probe)
+            result['smtp_code'] = self._local.rcpt_code
+            if self._local.rcpt_code in KNOWN_BAD_CODES:
+                result['known_bad'] = 'email'
+
+            # Catch-all domain check
+            if is_catch_all is None:
+                is_catch_all = self._cached_catch_all(domain, record=False)
+            if is_catch_all is None:
+                is_catch_all = self._probe_catch_all(domain, policy)
+            result['is_catch_all'] = is_catch_all
+
+        except ProbeDeferred as e:
+            result['deferred'] = True
+            result['errors'].append(str(e))
+        except Exception as e:
+            result['errors'].append(str(e))
+        finally:
+            verdict = self.verdict(result, self.engine)
+            EMAILS_VALIDATED.inc(verdict)
+            self.stats.inc('verdict', verdict)
+            if self.trace_enabled:
+                self._finish_trace(verdict)
+
+        return result
+
+    def _mark(self, event: str, detail=None):
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace.mark(event, detail)
+
+    def _finish_trace(self, verdict: str):
+        trace = self._local.trace
+        self._local.trace = None
+        trace.mark('done', verdict)
+        if trace.finish() >= self.config['TRACE_SLOW_SECONDS']:
+            slow_traces.add(trace)
+
+    @staticmethod
+    def verdict(result: dict, engine: str = 'smtp') -> str:
+        """Single outcome label summarizing a validation result"""
+        if not result['syntax_valid']:
+            return 'invalid_syntax'
+        if result['is_disposable']:
+            return 'disposable'
+        if engine == 'syntax':
+            return 'valid_syntax'
+        if not result['domain_valid']:
+            return 'invalid_domain'
+        if engine == 'dns':
+            return 'valid_domain'
+        if result.get('deferred'):
+            return 'deferred'
+        if result['is_catch_all']:
+            return 'catch_all'
+        return 'deliverable' if result['smtp_valid'] else 'undeliverable'
+
+    def check_domain(self, domain: str) -> bool:
+        """Check domain MX records with caching"""
+        return self.resolve_mx(domain) is not None
+
+    def resolve_mx(self, domain: str):
+        """Return the preferred MX host of a domain (None if it has none), with caching"""
+        now = time.time()
+        with self._cache_lock:
+            cached = self._domain_cache.get(domain)
+            if cached and (now - cached[1]) < self.config['CACHE_TIMEOUT']:
+                CACHE_LOOKUPS.inc('domain', 'hit')
+                self.stats.inc('cache', 'domain', 'hit')
+                return cached[0]
+        CACHE_LOOKUPS.inc('domain', 'miss')
+        self.stats.inc('cache', 'domain', 'miss')
+
+        started = time.perf_counter()
+        self.stats.inc('in_flight', 'dns')
+        self._mark('dns_query', domain)
+        dead = False
+        try:
+            mx_records = self.resolver.resolve(domain, 'MX', lifetime=5)
+            mx_host = str(min(mx_records, key=lambda record: record.preference).exchange)
+        except Exception as e:
+            import dns.resolver
+            logger.debug(f"Domain check failed: {str(e)}")
+            mx_host = None
+            dead = isinstance(e, dns.resolver.NXDOMAIN)
+        finally:
+            self.stats.inc('in_flight', 'dns', amount=-1)
+        self._mark('dns_answer', mx_host)
+        STAGE_SECONDS.observe(time.perf_counter() - started, 'dns')
+        with self._cache_lock:
+            self._domain_cache[domain] = (mx_host, now, dead)
+        return mx_host
+
+    def is_dead_domain(self, domain: str) -> bool:
+        """Whether the last MX lookup of the domain answered NXDOMAIN"""
+        with self._cache_lock:
+            cached = self._domain_cache.get(domain)
+        return cached is not None and cached[2]
+
+    def check_smtp(self, email: str, domain: str, policy: ProviderPolicy = DEFAULT_POLICY,
+                   catch_all_probe: str = None) -> bool:
+        """Perform SMTP check with timeout.
+
+        When ``catch_all_probe`` is given, the random address is probed in the
+        same session after the real one and the catch-all cache is filled,
+        saving a second connection to the MX. A session the MX refuses is
+        retried once with another outbound identity, if one is ready. When
+        no identity is ready for the MX, the session waits up to
+        IDENTITY_MAX_WAIT seconds for one; after that the probe is deferred:
+        ProbeDeferred is raised without connecting.
+        """
+        started = time.perf_counter()
+        mx_server = None
+        self._local.rcpt_code = None
+        try:
+            mx_server = self.resolve_mx(domain)
+            if mx_server is None:
+                return False
+
+            self.stats.inc('in_flight', 'smtp')
+            identity = self.identities.acquire(mx_server, wait=self.config['IDENTITY_MAX_WAIT'])
+            if identity is None:
+                self.stats.inc('deferred')
+                self._mark('deferred', 'no identity ready')
+                raise ProbeDeferred(f"SMTP probe deferred: no outbound identity ready for {mx_server}")
+            tried = []
+            while True:
+                tried.append(identity.name)
+                code, blocked = self._smtp_session(email, domain, mx_server, policy, identity, catch_all_probe)
+                self.identities.record(identity, mx_server, blocked)
+                IDENTITY_SESSIONS.inc(identity.name, 'blocked' if blocked else 'ok')
+                if not blocked:
+                    self._local.rcpt_code = code
+                if not blocked or len(tried) > 1:
+                    return code == 250
+                identity = self.identities.acquire(mx_server, exclude=tried)
+                if identity is None:
+                    return False
+                self.stats.inc('retries')
+                self._mark('retry', identity.name)
+        except ProbeDeferred:
+            raise
+        except Exception as e:
+            logger.debug(f"SMTP check failed: {str(e)}")
+            SMTP_RESPONSES.inc('error')
+            self._mark('smtp_error', str(e))
+            return False
+        finally:
+            if mx_server is not None:
+                self.stats.inc('in_flight', 'smtp', amount=-1)
+            PROVIDER_SECONDS.observe(time.perf_counter() - started, mx_provider(self.providers.provider(mx_server)))
+
+    def _smtp_session(self, email: str, domain: str, mx_server: str, policy: ProviderPolicy,
+                      identity, catch_all_probe: str = None) -> tuple:
+        """One RCPT probe from ``identity``; returns (RCPT code, refused by the MX)"""
+        import smtplib
+
+        started = time.perf_counter()
+        trace = getattr(self._local, 'trace', None)
+        smtp_class = _traced_smtp()
+        self._mark('identity', identity.name)
+        try:
+            with policy.session(), smtp_class(trace, timeout=self.config['SMTP_TIMEOUT'],
+                                              source_address=identity.bind_address) as server:
+                code, message = server.connect(mx_server, self.config['SMTP_PORT'])
+                self._mark('banner', code)
+                if code != 220:
+                    return None, True
+                helo = identity.helo or policy.helo or self.config['SMTP_HELO']
+                code, _ = server.docmd(f'HELO {helo}')
+                self._mark('helo', code)
+                if code != 250:
+                    return None, True
+                code, _ = server.docmd(f'MAIL FROM:<{identity.sender(domain)}>')
+                self._mark('mail', code)
+                if code != 250:
+                    return None, True
+                connected = time.perf_counter()
+                STAGE_SECONDS.observe(connected - started, 'smtp_connect')
+                code, message = server.docmd(f'RCPT TO:<{email}>')
+                self._mark('rcpt', code)
+                STAGE_SECONDS.observe(time.perf_counter() - connected, 'rcpt')
+                SMTP_RESPONSES.inc(str(code))
+                if is_block(code, message):
+                    return code, True
+                if 400 <= code < 500:
+                    self.stats.inc('deferred')
+                elif catch_all_probe:
+                    self._batched_catch_all_probe(server, domain, catch_all_probe)
+                return code, False
+        except smtplib.SMTPServerDisconnected as e:
+            # Dropped during the greeting: treated as a refusal of this identity
+            # (a refused connection means the MX is down and reaches check_smtp)
+            self._mark('smtp_error', str(e))
+            return None, True
+
+    def _batched_catch_all_probe(self, server, domain: str, test_email: str):
+        started = time.perf_counter()
+        self._mark('catch_all_probe', test_email)
+        code, _ = server.docmd(f'RCPT TO:<{test_email}>')
+        self._mark('catch_all_result', code)
+        SMTP_RESPONSES.inc(str(code))
+        STAGE_SECONDS.observe(time.perf_counter() - started, 'catch_all')
+        # Only a definite answer says anything about the domain
+        if code < 400 or code >= 500:
+            self._store_catch_all(domain, code == 250)
+
+    def check_catch_all(self, domain: str) -> bool:
+        """Check catch-all status with caching"""
+        cached = self._cached_catch_all(domain)
+        if cached is not None:
+            return cached
+        return self._probe_catch_all(domain)
+
+    def _cached_catch_all(self, domain: str, record: bool = True):
+        """Cached catch-all status, or None when unknown or expired"""
+        now = time.time()
+        with self._catch_all_lock:
+            cached = self._catch_all_cache.get(domain)
+            if cached and (now - cached[1]) < self.config['CACHE_TIMEOUT']:
+                if record:
+                    CACHE_LOOKUPS.inc('catch_all', 'hit')
+                    self.stats.inc('cache', 'catch_all', 'hit')
+                return cached[0]
+        if record:
+            CACHE_LOOKUPS.inc('catch_all', 'miss')
+            self.stats.inc('cache', 'catch_all', 'miss')
+        return None
+
+    def _store_catch_all(self, domain: str, is_catch_all: bool):
+        with self._catch_all_lock:
+            self._catch_all_cache[domain] = (is_catch_all, time.time())
+
+    def _probe_catch_all(self, domain: str, policy: ProviderPolicy = DEFAULT_POLICY) -> bool:
+        started = time.perf_counter()
+        test_email = self._catch_all_address(domain)
+        self.stats.inc('in_flight', 'catch_all')
+        self._mark('catch_all_probe', test_email)
+        try:
+            is_catch_all = self.check_smtp(test_email, domain, policy)
+        finally:
+            self.stats.inc('in_flight', 'catch_all', amount=-1)
+        self._mark('catch_all_result', is_catch_all)
+        STAGE_SECONDS.observe(time.perf_counter() - started, 'catch_all')
+        self._store_catch_all(domain, is_catch_all)
+        return is_catch_all
+
+    @staticmethod
+    def _catch_all_address(domain: str) -> str:
+        return f'test-{datetime.now().timestamp()}@{domain}'
@@ -0,0 +1,11 @@
+"""WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py
+
+Settings are read from the Python file named by EMAILVALID_SETTINGS, e.g.
+``UPLOAD_FOLDER = '/var/lib/emailvalid'``.
+"""
+# The app module builds its app with create_app() at import, from those settings
+from app import app
+
+__all__ = ['app']